@@ -0,0 +1,156 @@
+import os
+import json
+import gzip
+import hashlib
+from datetime import datetime
+from bootstrap import CACHE_DIR
+
+"""
+Every raw payload the collector receives is kept in a compressed, content addressed archive so the features and
+response tables can be rebuilt for past gameweeks. Payloads are stored gzipped under the sha256 of their content,
+so an unchanged payload is only ever stored once, and an index records when each payload was seen.
+
+The archive lives in FPL_ARCHIVE_DIR, either an S3 location ('s3://bucket/prefix') or a local directory. It has to
+outlive the collector, so on Lambda, where the local disk is lost with every container, FPL_ARCHIVE_DIR must be set
+to an S3 location. Elsewhere it defaults to a directory next to the bootstrap cache.
+
+On S3 every round trip counts against the collector's time budget, so the payloads stored together by put_many,
+such as one run's element summaries, are written as a single gzipped bundle stored under the sha256 of its content,
+and their index entries as a single index object, whatever the number of payloads.
+"""
+
+ARCHIVE_DIR = os.environ.get('FPL_ARCHIVE_DIR')
+# set by the Lambda runtime
+ON_LAMBDA = 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+
+
+class Archive:
+    """ Content addressed store of raw API payloads.
+    Args:
+        archive_dir: S3 location or directory holding the objects and the index, defaults to FPL_ARCHIVE_DIR
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR):
+        if archive_dir is None:
+            if ON_LAMBDA:
+                raise ValueError('FPL_ARCHIVE_DIR must be set to an S3 location on Lambda, the local disk does not '
+                                 'outlive the container')
+            archive_dir = os.path.join(CACHE_DIR, 'archive')
+        self.archive_dir = archive_dir
+        self.objects_dir = os.path.join(archive_dir, 'objects')
+        self.index_path = os.path.join(archive_dir, 'index.jsonl')
+        self.s3 = None
+        if archive_dir.startswith('s3://'):
+            import boto3
+            self.s3 = boto3.client('s3')
+            self.bucket, _, prefix = archive_dir[len('s3://'):].partition('/')
+            self.prefix = prefix.rstrip('/') + '/' if prefix.strip('/') else ''
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:] + '.json.gz')
+
+    def _bundle_key(self, digest):
+        return '{}bundles/{}/{}.json.gz'.format(self.prefix, digest[:2], digest[2:])
+
+    def _s3_exists(self, key):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.s3.exceptions.ClientError:
+            return False
+
+    def put(self, kind: str, key, payload, fetched_at: datetime = None):
+        """ Store a payload and record it in the index.
+        Args:
+            kind: the endpoint the payload came from, e.g. 'bootstrap-static' or 'element-summary'
+            key: identifies the payload within its kind, e.g. the player id, or None
+            payload: the parsed json payload
+            fetched_at: when the payload was fetched, defaults to now
+        Returns the sha256 digest the payload is stored under.
+        """
+        return self.put_many(kind, {key: payload}, fetched_at)[key]
+
+    def put_many(self, kind: str, payloads: dict, fetched_at: datetime = None):
+        """ Store several payloads of one kind and record them in the index, in one bundle and one index object on
+        S3. payloads maps each payload's key to the parsed json payload, and the digest each payload is stored
+        under is returned in a dict with the same keys. """
+
+        if not payloads:
+            return {}
+
+        # serialise canonically so identical payloads always hash the same
+        data = {key: json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+                for key, payload in payloads.items()}
+        digests = {key: hashlib.sha256(value).hexdigest() for key, value in data.items()}
+        fetched_at = (fetched_at or datetime.now()).replace(microsecond=0).isoformat()
+        entries = [{'kind': kind, 'key': key, 'fetched_at': fetched_at, 'sha256': digests[key]} for key in payloads]
+
+        if self.s3 is None:
+            for key, value in data.items():
+                path = self._object_path(digests[key])
+                if os.path.exists(path):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + '.tmp'
+                with gzip.open(tmp_path, 'wb') as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(self.index_path, 'a') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in entries)
+            return digests
+
+        # the bundle maps each digest to its payload, and is itself content addressed
+        bundle = b'{' + b','.join(json.dumps(digests[key]).encode() + b':' + value
+                                  for key, value in sorted(data.items(), key=lambda item: digests[item[0]])) + b'}'
+        bundle_digest = hashlib.sha256(bundle).hexdigest()
+        if not self._s3_exists(self._bundle_key(bundle_digest)):
+            self.s3.put_object(Bucket=self.bucket, Key=self._bundle_key(bundle_digest), Body=gzip.compress(bundle))
+
+        # S3 objects cannot be appended to, so each batch of entries is an object of its own, whose key starts with
+        # the time the payloads were fetched so the index is listed back in order
+        for entry in entries:
+            entry['bundle'] = bundle_digest
+        self.s3.put_object(Bucket=self.bucket, Key='{}index/{}/{}/{}.jsonl'.format(
+            self.prefix, fetched_at, kind, bundle_digest), Body=''.join(json.dumps(entry) + '\n' for entry in entries))
+
+        return digests
+
+    def get(self, digest: str, bundle: str = None):
+        """ Load a payload by its digest, and on S3 the digest of the bundle holding it, as found in its index entry """
+        if self.s3 is not None:
+            return self._read_bundle(bundle)[digest]
+        with gzip.open(self._object_path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    def get_many(self, entries):
+        """ Load the payloads of several index entries, in the same order, reading each S3 bundle only once """
+        if self.s3 is None:
+            return [self.get(entry['sha256']) for entry in entries]
+        bundles = {digest: self._read_bundle(digest) for digest in {entry['bundle'] for entry in entries}}
+        return [bundles[entry['bundle']][entry['sha256']] for entry in entries]
+
+    def _read_bundle(self, digest):
+        body = self.s3.get_object(Bucket=self.bucket, Key=self._bundle_key(digest))['Body'].read()
+        return json.loads(gzip.decompress(body))
+
+    def _s3_entries(self):
+        entries = []
+        pages = self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix + 'index/')
+        # keys are listed in order, and start with the time each batch of payloads was fetched
+        for page in pages:
+            for item in page.get('Contents', []):
+                body = self.s3.get_object(Bucket=self.bucket, Key=item['Key'])['Body'].read().decode()
+                entries.extend(json.loads(line) for line in body.splitlines() if line.strip())
+        return entries
+
+    def entries(self, kind: str = None):
+        """ Return the index entries, oldest first, optionally only those of one kind """
+        if self.s3 is not None:
+            entries = self._s3_entries()
+        elif not os.path.exists(self.index_path):
+            return []
+        else:
+            with open(self.index_path) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        return [entry for entry in entries if kind is None or entry['kind'] == kind]
@@ -0,0 +1,167 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from archive import Archive
+from data_collection import get_history_data
+from db_writer import write_frame
+from schema import season_of, migrate, ensure_partition
+
+"""
+Rebuilds the features, response and history tables for whole seasons from the raw payload archive. The latest
+element summary archived for each player holds every match they have played that season, so all of a season's
+gameweeks can be reconstructed in one vectorised pass over the concatenated histories rather than replayed week by
+week, and the histories themselves fill the history table the rolling features are built from.
+"""
+
+
+def load_season(archive, season):
+    """ Return the latest bootstrap payload and the latest element summary of each player archived in a season """
+
+    bootstrap_entry = None
+    summary_entries = {}
+
+    # index entries are oldest first, so later entries overwrite earlier ones
+    for entry in archive.entries():
+        if season_of(entry['fetched_at']) != season:
+            continue
+        if entry['kind'] == 'bootstrap-static':
+            bootstrap_entry = entry
+        elif entry['kind'] == 'element-summary':
+            summary_entries[entry['key']] = entry
+
+    if bootstrap_entry is None:
+        raise ValueError('No bootstrap data archived for season {}'.format(season))
+
+    bootstrap, *summaries = archive.get_many([bootstrap_entry, *summary_entries.values()])
+    return bootstrap, summaries
+
+
+def build_season(bootstrap, summaries):
+    """
+    Build the features and response rows for every gameweek of a season, returned as two dataframes sharing a
+    row index along with the gameweek of each row, the deadline of each gameweek and every match of the season
+    as rows of the history table. Each row only uses matches played before its gameweek, mirroring what the live
+    collector would have seen at the time. chance_of_playing is not recoverable from the histories and is left
+    blank.
+    """
+
+    teams = pd.DataFrame.from_records(bootstrap['teams']).set_index('id')
+    elements = pd.DataFrame.from_records(bootstrap['elements']).set_index('id')
+    events = pd.DataFrame.from_records(bootstrap['events']).set_index('id')
+    deadlines = pd.to_datetime(events['deadline_time']).dt.tz_convert(None)
+
+    # concatenate every player's match history into one long frame, as the collector writes it to the history table
+    history = get_history_data(summaries)
+
+    # collapse double gameweeks into one row per player per gameweek
+    matches = history.assign(element=history['player_id'], appearances=history['minutes'] > 0).groupby(
+        ['element', 'round']).agg(
+        total_points=('total_points', 'sum'),
+        ict_index=('ict_index', 'sum'),
+        appearances=('appearances', 'sum'),
+        was_home=('was_home', 'first'),
+        opponent_team=('opponent_team', 'first'),
+        kickoff_time=('kickoff_time', 'min')
+    ).reset_index().sort_values(['element', 'kickoff_time'], ignore_index=True)
+
+    by_player = matches.groupby('element')
+
+    # form is the mean points over the last 30 days, computed per player over kickoff times
+    form = matches.set_index('kickoff_time').groupby('element')['total_points'].rolling('30D').mean().values
+
+    # shift within each player so every gameweek only sees the matches before it
+    def previous(values):
+        return pd.Series(values, index=matches.index).groupby(matches['element']).shift(1)
+
+    cumulative_appearances = previous(by_player['appearances'].cumsum())
+
+    features = pd.DataFrame({
+        'player_id': matches['element'],
+        'team_id': matches['element'].map(elements['team']),
+        'ict_index': previous(by_player['ict_index'].cumsum()),
+        'chance_of_playing': np.nan,
+        'form': previous(form),
+        'points_per_game': previous(by_player['total_points'].cumsum()) / cumulative_appearances.replace(0, np.nan),
+        'previous_points': previous(matches['total_points']),
+        'is_home': matches['was_home'].astype(int),
+        # the fixture difficulty rating follows the strength of the opposition
+        'next_fixture_difficulty': matches['opponent_team'].map(teams['strength']),
+        'timestamp': matches['round'].map(deadlines),
+        'season': season_of(deadlines.min()),
+        'gameweek': matches['round']
+    })
+    fill_columns = features.columns.drop(['chance_of_playing', 'timestamp'])
+    features[fill_columns] = features[fill_columns].fillna(0)
+    response = matches['total_points'].rename('points_scored').to_frame()
+
+    return features, response, matches['round'], deadlines, history
+
+
+def collected_gameweeks(engine, season):
+    """ Gameweeks of a season the database already has rows for """
+    if not engine.has_table('features'):
+        return set()
+    query = db.text('SELECT DISTINCT gameweek FROM features WHERE season = :season')
+    return {row[0] for row in engine.execute(query, season=season)}
+
+
+def backfill(seasons, db_uri=os.environ.get('POSTGRES'), archive=None):
+    """ Rebuild the features and response rows of each season from the archive and append them to the database,
+    skipping any gameweek the live collector has already stored. """
+
+    if archive is None:
+        archive = Archive()
+    engine = db.create_engine(db_uri)
+
+    for season in seasons:
+        print('Backfilling season {}...'.format(season))
+        bootstrap, summaries = load_season(archive, season)
+        features, response, gameweeks, deadlines, history = build_season(bootstrap, summaries)
+        # place rows collected before the gameweek column existed using this season's deadlines
+        migrate(engine, deadlines)
+
+        # leave gameweeks already collected live untouched
+        keep = ~gameweeks.isin(collected_gameweeks(engine, season))
+        features, response = features[keep], response[keep]
+
+        # allocate entry ids after the current maximum
+        try:
+            auto_increment = list(engine.execute('SELECT MAX(entry_id) FROM features'))[0][0] + 1
+        except:
+            auto_increment = 1
+        entry_ids = pd.Index(np.arange(auto_increment, auto_increment + len(features)), name='entry_id')
+        features.index = entry_ids
+        response.index = entry_ids
+
+        with engine.begin() as connection:
+            ensure_partition(connection, season)
+            write_frame(features, 'features', connection)
+            write_frame(response, 'response', connection)
+            migrate(connection, deadlines)
+
+            # the archived histories are complete, so they replace any of the season's matches the collector stored
+            if connection.dialect.has_table(connection, 'history'):
+                connection.execute(db.text('DELETE FROM history WHERE kickoff_time >= :season_start AND '
+                                           'kickoff_time <= :season_end AND player_id IN :player_ids').bindparams(
+                                       db.bindparam('season_start', type_=db.DateTime),
+                                       db.bindparam('season_end', type_=db.DateTime),
+                                       db.bindparam('player_ids', expanding=True)),
+                                   season_start=history['kickoff_time'].min().to_pydatetime(),
+                                   season_end=history['kickoff_time'].max().to_pydatetime(),
+                                   player_ids=[int(player_id) for player_id in history['player_id'].unique()])
+            write_frame(history, 'history', connection, index=False)
+
+        print('Added {} rows covering {} gameweeks and {} matches for season {}.'.format(
+            len(features), gameweeks[keep].nunique(), len(history), season))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild the features and response tables from archived payloads')
+    parser.add_argument('seasons', type=int, nargs='+', help='seasons to backfill, identified by their start year')
+    parser.add_argument('--db-uri', default=os.environ.get('POSTGRES'))
+    parser.add_argument('--archive-dir', default=None)
+    args = parser.parse_args()
+
+    backfill(args.seasons, args.db_uri, Archive(args.archive_dir) if args.archive_dir else None)
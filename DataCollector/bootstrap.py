@@ -0,0 +1,121 @@
+import os
+import json
+import pandas as pd
+from fetcher import Fetcher
+
+"""
+The bootstrap-static payload is several megabytes and is needed by every collector. BootstrapSnapshot fetches it
+once per run and keeps it on disk along with its ETag and Last-Modified headers, so the next run can revalidate it
+with a conditional GET and skip the download when nothing has changed upstream. A newly downloaded payload is only
+written to disk by commit(), once every collector using it has succeeded, so a failed run is retried in full by the
+next one rather than being answered with 304 Not Modified.
+"""
+
+CACHE_DIR = os.environ.get('FPL_CACHE_DIR', '/tmp/fpl_cache')
+
+
+class BootstrapSnapshot:
+    """ A single bootstrap-static payload shared between the collectors of one run.
+    Args:
+        fetcher: Fetcher used to make the request, a new one is created if not given
+        cache_dir: directory the payload and its validators are stored in
+    """
+
+    def __init__(self, fetcher: Fetcher = None, cache_dir: str = CACHE_DIR):
+        self.fetcher = fetcher or Fetcher()
+        self.cache_dir = cache_dir
+        self.payload_path = os.path.join(cache_dir, 'bootstrap-static.json')
+        self.meta_path = os.path.join(cache_dir, 'bootstrap-static.meta.json')
+        # whether the payload changed upstream since the last run, None until loaded
+        self.modified = None
+        self._payload = None
+        self._frames = {}
+        # the downloaded payload and its validators, waiting to be written by commit()
+        self._pending = None
+
+    def _read_meta(self):
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.payload_path)):
+            return {}
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def _write(self, path, data, mode='w'):
+        # write to a temporary file first so an interrupted run never leaves a truncated payload behind
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """ Fetch the payload, revalidating the copy on disk if there is one. Only the first call per
+        snapshot makes a request. """
+
+        if self._payload is not None:
+            return self
+
+        # send the validators from the last run so the API can answer 304 Not Modified
+        meta = self._read_meta()
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.fetcher.get('bootstrap-static/', headers=headers)
+
+        if response.status_code == 304:
+            print('Bootstrap data unchanged since last run, using cached copy.')
+            with open(self.payload_path) as f:
+                self._payload = json.load(f)
+            self.modified = False
+        else:
+            self._payload = response.json()
+            self.modified = True
+            self._pending = (response.content, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            })
+
+        return self
+
+    def commit(self):
+        """ Store the downloaded payload and its validators for the next run to revalidate against. Call this once
+        every collector using the snapshot has succeeded. """
+
+        if self._pending is None:
+            return
+        content, meta = self._pending
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write(self.payload_path, content, mode='wb')
+        self._write(self.meta_path, json.dumps(meta))
+        self._pending = None
+
+    @property
+    def payload(self):
+        return self.load()._payload
+
+    def _frame(self, key):
+        # build each dataframe straight from the parsed records, once per run
+        if key not in self._frames:
+            self._frames[key] = pd.DataFrame.from_records(self.payload[key])
+        return self._frames[key]
+
+    @property
+    def events(self):
+        if 'events' not in self._frames:
+            events = self._frame('events')
+            events['deadline_time'] = pd.to_datetime(events['deadline_time'])
+        return self._frames['events']
+
+    @property
+    def elements(self):
+        return self._frame('elements')
+
+    @property
+    def teams(self):
+        return self._frame('teams')
+
+    @property
+    def players(self):
+        """ The raw list of player dicts, as consumed by get_feature_data """
+        return self.payload['elements']
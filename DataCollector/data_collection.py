@@ -1,9 +1,15 @@
-import requests
-import json
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from player import Player
+from fetcher import Fetcher
+from bootstrap import BootstrapSnapshot
+from summary_cache import SummaryCache, fingerprint, schedule_fingerprint, team_fixtures_fingerprints
+from archive import Archive
+from db_writer import write_frame
+from feature_schema import apply_schema, apply_series_schema
+from schema import LATEST_GAMEWEEK_QUERY, season_of, migrate, ensure_partition
+from metrics import instrument, checkpoint, record_rows
 import sqlalchemy as db
 import os
 
@@ -12,11 +18,53 @@ We must collect the data we need. We use a function which takes the list of play
 API and gathers information needed, also making use of the Player class from player.py
 """
 
-def get_feature_data(player_list):
+def get_element_summaries(player_list, fetcher=None, cache=None, current_event=None, archive=None, schedule=None,
+                          team_fixtures=None):
+
+    """
+    Gathers the element summary of every player in player_list. Summaries are fetched concurrently through a
+    Fetcher, and only for players whose fingerprint in the SummaryCache has changed; the rest are served from the
+    cache. The freshly fetched summaries are also stored in the raw payload Archive, all at once. Returns the
+    summaries in the order of player_list, None where a request failed, and a dict mapping failed player ids to the
+    reason.
+    schedule is the schedule_fingerprint of the bootstrap events, so rescheduled fixtures are refetched, and
+    team_fixtures the team_fixtures_fingerprints of the fixtures, so fixtures moved between gameweeks are too.
+    """
+
+    if fetcher is None:
+        fetcher = Fetcher()
+    if cache is None:
+        cache = SummaryCache()
+    if archive is None:
+        archive = Archive()
+
+    # look up each player's element summary in the cache, collecting the players that need refetching
+    fingerprints = [fingerprint(player, current_event, schedule, team_fixtures) for player in player_list]
+    summaries = [cache.get(player['id'], player_fingerprint)
+                 for player, player_fingerprint in zip(player_list, fingerprints)]
+    stale = [i for i, summary in enumerate(summaries) if summary is None]
+
+    # fetch the stale summaries concurrently, results come back in the order requested
+    fetched, failures = fetcher.element_summaries([player_list[i]['id'] for i in stale])
+    for i, summary in zip(stale, fetched):
+        if summary is not None:
+            cache.put(player_list[i]['id'], fingerprints[i], summary)
+        summaries[i] = summary
+    archive.put_many('element-summary', {player_list[i]['id']: summary for i, summary in zip(stale, fetched)
+                                         if summary is not None})
+    cache.report()
+    cache.save()
+
+    return summaries, failures
+
+
+def get_feature_data(player_list, summaries=None, failures=None):
 
     """
     Creates a dataframe player_data with player data including form, next fixture opposition strength and 
-    each players points per game
+    each players points per game. The element summaries from get_element_summaries can be passed in, otherwise
+    they are gathered here. Any player whose data could not be gathered is left out and listed in a failure
+    report rather than ending the loop.
     """
     print("Gathering up to date player data...")
 
@@ -27,27 +75,41 @@ def get_feature_data(player_list):
     # columns to be extracted from element fixtures
     fixture_columns = ['is_home', 'difficulty']
 
+    if summaries is None:
+        summaries, failures = get_element_summaries(player_list)
+    failures = dict(failures or {})
+
     # create empty dataframe as an empty list 
     player_data = []
 
     # For each player:
-    for player in player_list:
-        # create a class instance for player specific data
-        player_cls = Player(player['id'])
+    for player, summary in zip(player_list, summaries):
+        # skip players whose request failed, they are already in the failure report
+        if summary is None:
+            continue
         # make an empty row
         row = []
         # loop over all the necessary columns, appending the values to the empty row
         try: 
+            # create a class instance for player specific data
+            player_cls = Player(player['id'], summary)
             for column in bootstrap_columns:
                 row.append(player[column])
             for column in player_columns:
                 row.append(player_cls.history[column])
             for column in fixture_columns:
                 row.append(player_cls.fixtures[column])
-        except:
-            break
+        except (KeyError, IndexError, TypeError) as error:
+            failures[player['id']] = repr(error)
+            continue
         player_data.append(row)
 
+    # report any players that could not be gathered
+    if failures:
+        print("Failed to gather data for {} of {} players:".format(len(failures), len(player_list)))
+        for player_id, reason in failures.items():
+            print("    player {}: {}".format(player_id, reason))
+
     # Add the matrix of data in player_data to a pandas dataframe with all the relevant columns, index is id
     player_data = pd.DataFrame(player_data, columns=bootstrap_columns+player_columns+fixture_columns).set_index('id')
     # map is_home to integer
@@ -67,20 +129,66 @@ def get_response_data(entry_player_mapping, player_data):
     return entry_player_mapping.join(player_data, on='id')['points_scored']
 
 
-def data_collection(db_uri=os.environ.get('POSTGRES')):
+def get_history_data(summaries):
+
+    """Function takes the element summaries from get_element_summaries and returns every match in each player's
+    history as one long dataframe, with one row per player per fixture, ready for the history table."""
+
+    history_columns = ['element', 'fixture', 'round', 'kickoff_time', 'was_home', 'opponent_team', 'total_points',
+                       'minutes', 'bps', 'influence', 'creativity', 'threat', 'ict_index']
+
+    history = pd.DataFrame.from_records([match for summary in summaries if summary is not None
+                                         for match in summary['history']], columns=history_columns)
+    history = history.rename(columns={'element': 'player_id'})
+    history['kickoff_time'] = pd.to_datetime(history['kickoff_time'], utc=True).dt.tz_convert(None)
+    for column in ['influence', 'creativity', 'threat', 'ict_index']:
+        history[column] = history[column].astype(float)
+    history['was_home'] = history['was_home'].astype(int)
+
+    return history
+
+
+def get_fixture_data(player_list, summaries):
+
+    """Function takes the element summaries from get_element_summaries and returns every upcoming fixture of each
+    player as one long dataframe, with one row per player per fixture, ready for the fixtures table. Fixtures
+    which have not been scheduled into a gameweek yet are left out."""
+
+    fixture_columns = ['id', 'event', 'kickoff_time', 'is_home', 'difficulty']
+
+    fixtures = pd.DataFrame.from_records([dict(fixture, player_id=player['id'])
+                                          for player, summary in zip(player_list, summaries) if summary is not None
+                                          for fixture in summary['fixtures']],
+                                         columns=['player_id'] + fixture_columns)
+    fixtures = fixtures.rename(columns={'id': 'fixture'}).dropna(subset=['event'])
+    fixtures['kickoff_time'] = pd.to_datetime(fixtures['kickoff_time'], utc=True).dt.tz_convert(None)
+    fixtures['event'] = fixtures['event'].astype(int)
+    fixtures['is_home'] = fixtures['is_home'].astype(int)
+
+    return fixtures
+
+
+@instrument('data_collection')
+def data_collection(db_uri=os.environ.get('POSTGRES'), snapshot=None):
     """
-    First step is to request all the data from the bootstrap page of the API in order to collect general player and team data
+    First step is to request all the data from the bootstrap page of the API in order to collect general player and team data.
+    A BootstrapSnapshot shared with the other collectors can be passed in so the payload is only fetched once per run.
     """
 
-    # request data from API
-    bootstrap_request = requests.get("https://fantasy.premierleague.com/api/bootstrap-static/")
+    # request data from API, or reuse the snapshot already fetched this run
+    owns_snapshot = snapshot is None
+    if owns_snapshot:
+        snapshot = BootstrapSnapshot()
+    snapshot.load()
 
-    # convert request to json
-    request_json = bootstrap_request.json()
+    # keep the raw payload in the archive, unchanged payloads are only stored once
+    archive = Archive()
+    archive.put('bootstrap-static', None, snapshot.payload)
+    checkpoint('bootstrap')
 
-    # extract lists of events, players, and teams
-    events = pd.read_json(json.dumps(request_json["events"]))
-    players = request_json["elements"]
+    # extract lists of events and players
+    events = snapshot.events
+    players = snapshot.players
 
     """
     Finally, we check if an update needs to be performed. If the current gameweek is not finished, no update is performed.
@@ -88,50 +196,48 @@ def data_collection(db_uri=os.environ.get('POSTGRES')):
     the auto increment and dump the new data to the database.
     """
 
-    # connect to database
+    # connect to database and bring the features table up to date with the schema
     engine = db.create_engine(db_uri)
+    deadlines = pd.to_datetime(events.set_index('id')['deadline_time']).dt.tz_localize(None)
+    migrate(engine, deadlines)
 
     # is update needed?
 
     print('Checking if current gameweek is finished...')
 
-    most_recent_update = list(engine.execute('SELECT MAX(TIMESTAMP) FROM features;'))[0][0]
+    # the season and gameweek of the latest rows in the database, if there are any
+    latest = list(engine.execute(LATEST_GAMEWEEK_QUERY)) if engine.has_table('features') else []
+    season = season_of(deadlines.min())
+    next_gameweek = int(list(events[events.finished == False].loc[:, 'id'])[0])
     next_unfinished_gameweek_start_time = list(events[events.finished == False].loc[:, 'deadline_time'])[0].replace(tzinfo=None)
     is_update_required = next_unfinished_gameweek_start_time > datetime.now()
+    checkpoint('check for update')
+
+    # the current event is part of every player's fingerprint, so a new gameweek refetches everyone
+    current_events = list(events[events.is_current].loc[:, 'id'])
+    current_event = int(current_events[0]) if current_events else 0
+    # as are the deadlines still to come, so a rescheduled gameweek refetches everyone's upcoming fixtures
+    schedule = schedule_fingerprint(snapshot.payload['events'])
 
     # if update needed
     if is_update_required:
 
         print('Current gameweek is finished, proceeding to get updated data')
 
-        # get updated data
-        new_data = get_feature_data(players)
-
-        try:
-            # check if data for next gameweek exists in the database
-            last_finished_gameweek_start_time = list(pd.to_datetime(events[events.finished].loc[:, 'deadline_time']))[-1].replace(tzinfo=None)
-            does_next_gameweek_data_exist = most_recent_update > last_finished_gameweek_start_time
-        except: does_next_gameweek_data_exist = False
-
-        # if it exists
-        if does_next_gameweek_data_exist:
+        # one request for every fixture, so the players of teams whose fixtures have moved are refetched
+        team_fixtures = team_fixtures_fingerprints(snapshot.fetcher.get_json('fixtures/'))
 
-            print("Removing out of date data...")
-
-            # delete most recent data
-            engine.execute('DELETE FROM features WHERE timestamp=(SELECT MAX(timestamp) FROM features);')
-
-            print("Out of date data removed.")
+        # get updated data
+        summaries, failures = get_element_summaries(players, snapshot.fetcher, current_event=current_event,
+                                                    archive=archive, schedule=schedule, team_fixtures=team_fixtures)
+        checkpoint('element summaries')
+        new_data = get_feature_data(players, summaries, failures)
+        history = get_history_data(summaries)
+        fixtures = get_fixture_data(players, summaries)
+        checkpoint('feature data')
 
-        else: 
-            # if we haven't already collected the new data, we can get the response data
-            query = 'SELECT entry_id, player_id FROM features WHERE timestamp=(SELECT MAX(timestamp) FROM features);'
-            mapping = pd.read_sql(query, con=engine, index_col='entry_id')
-            mapping = mapping.rename(columns={'player_id': 'id'})
-            # function which extracts response data from gathered player data
-            response = get_response_data(mapping, new_data)
-            # dump response data to db
-            response.to_sql('response', con=engine, if_exists='append')
+        # check if data for next gameweek exists in the database
+        does_next_gameweek_data_exist = bool(latest) and tuple(latest[0]) == (season, next_gameweek)
 
         print("Preparing to insert feature data to database...")
         # rename the columns to more friendly names
@@ -141,26 +247,88 @@ def data_collection(db_uri=os.environ.get('POSTGRES')):
             'total_points': 'previous_points',
             'difficulty': 'next_fixture_difficulty'
         }
-        new_data = new_data.rename(columns=column_dict)
-        new_data = new_data.rename_axis('player_id')
-        # get max entry id
-        try: 
-            auto_increment = list(engine.execute('SELECT MAX(entry_id) FROM features'))[0][0] + 1
-        except:
-            auto_increment = 1
-        # reset index and set to auto_increment, then rename index as entry id
-        new_data = new_data.reset_index()
-        new_data.index = np.arange(auto_increment, auto_increment + len(new_data))
-        new_data = new_data.rename_axis('entry_id')
-
-        # add timestamp to new_data
-        new_data['timestamp'] = datetime.now().replace(microsecond=0)
-
-        print("Feature data prepared, adding to database...")
-        # dump data to features table within the database
-        new_data.to_sql('features', con=engine, if_exists='append')
-
+        feature_data = new_data.rename(columns=column_dict)
+        feature_data = feature_data.rename_axis('player_id').reset_index()
+
+        # add timestamp, season and gameweek to feature_data
+        feature_data['timestamp'] = datetime.now().replace(microsecond=0)
+        feature_data['season'] = season
+        feature_data['gameweek'] = next_gameweek
+
+        # give every column its compact type from the feature schema, so the table is created with small column types
+        feature_data = apply_schema(feature_data)
+
+        # replace the gameweek in a single transaction, so a failed run never leaves it half written
+        with engine.begin() as connection:
+
+            # if it exists
+            if does_next_gameweek_data_exist:
+
+                print("Removing out of date data...")
+
+                # delete most recent data
+                connection.execute(db.text('DELETE FROM features WHERE season = :season AND gameweek = :gameweek'),
+                                   season=season, gameweek=next_gameweek)
+
+                print("Out of date data removed.")
+
+            elif latest:
+                # if we haven't already collected the new data, we can get the response data
+                query = db.text('SELECT entry_id, player_id FROM features WHERE season = :season AND '
+                                'gameweek = :gameweek')
+                mapping = pd.read_sql(query, con=connection, index_col='entry_id',
+                                      params={'season': latest[0][0], 'gameweek': latest[0][1]})
+                record_rows('features', len(mapping), written=False)
+                mapping = mapping.rename(columns={'player_id': 'id'})
+                # function which extracts response data from gathered player data
+                response = apply_series_schema(get_response_data(mapping, new_data))
+                # dump response data to db
+                write_frame(response, 'response', connection)
+
+            # carry on from the last entry id, reusing those of any rows just deleted
+            if connection.dialect.has_table(connection, 'features'):
+                last_entry_id = list(connection.execute('SELECT MAX(entry_id) FROM features'))[0][0]
+            else:
+                last_entry_id = None
+            auto_increment = (last_entry_id or 0) + 1
+            # set index to auto_increment, then rename index as entry id
+            feature_data.index = np.arange(auto_increment, auto_increment + len(feature_data))
+            feature_data = feature_data.rename_axis('entry_id')
+
+            print("Feature data prepared, adding to database...")
+            # dump data to features table within the database, indexing it if this is the first write
+            ensure_partition(connection, season)
+            write_frame(feature_data, 'features', connection)
+            migrate(connection, deadlines)
+
+            # replace this season's match histories and the upcoming fixtures of the players fetched this run,
+            # keeping earlier seasons and the rows of any player whose summary could not be fetched
+            fetched_ids = [int(player['id']) for player, summary in zip(players, summaries) if summary is not None]
+            if len(history):
+                if connection.dialect.has_table(connection, 'history'):
+                    connection.execute(db.text('DELETE FROM history WHERE kickoff_time >= :season_start AND '
+                                               'player_id IN :player_ids').bindparams(
+                                           db.bindparam('player_ids', expanding=True)),
+                                       season_start=history['kickoff_time'].min().to_pydatetime(),
+                                       player_ids=fetched_ids)
+                write_frame(history, 'history', connection, index=False)
+
+            if connection.dialect.has_table(connection, 'fixtures') and fetched_ids:
+                connection.execute(db.text('DELETE FROM fixtures WHERE player_id IN :player_ids').bindparams(
+                                       db.bindparam('player_ids', expanding=True)),
+                                   player_ids=fetched_ids)
+            if connection.dialect.has_table(connection, 'fixtures'):
+                # the fixtures kept for players not fetched this run include the gameweeks already played
+                connection.execute(db.text('DELETE FROM fixtures WHERE event < :next_gameweek'),
+                                   next_gameweek=next_gameweek)
+            write_frame(fixtures, 'fixtures', connection, index=False)
+
+        checkpoint('database write')
         print('Data successfully added to database.')
 
     else: 
         print('Gameweek in progress, no update performed.')
+
+    # a snapshot fetched here is stored for the next run, a shared one is left to its owner
+    if owns_snapshot:
+        snapshot.commit()
@@ -0,0 +1,40 @@
+import io
+import csv
+import time
+from metrics import record_rows
+
+"""
+Bulk writes to the database. On PostgreSQL frames are streamed through COPY rather than inserted row by row, and
+on any other database (e.g. SQLite in tests) pandas' executemany insert is used instead. Writes should be made on
+a connection from engine.begin() so that everything written in one step is committed, or rolled back, together.
+"""
+
+
+def copy_insert(table, conn, keys, data_iter):
+    """ pandas to_sql insertion method which streams rows through PostgreSQL COPY """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(data_iter)
+    buffer.seek(0)
+
+    name = '{}.{}'.format(table.schema, table.name) if table.schema else table.name
+    columns = ', '.join('"{}"'.format(key) for key in keys)
+
+    # use the DBAPI connection underneath the SQLAlchemy one so the COPY runs inside the same transaction
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH CSV'.format(name, columns), buffer)
+
+
+def insert_method(connectable):
+    """ COPY on PostgreSQL, pandas' default insert anywhere else """
+    return copy_insert if connectable.dialect.name == 'postgresql' else None
+
+
+def write_frame(frame, table, connectable, if_exists='append', index=True):
+    """ Write a dataframe to a table using the fastest method the database supports and report the throughput """
+    start = time.perf_counter()
+    frame.to_sql(table, con=connectable, if_exists=if_exists, index=index, method=insert_method(connectable))
+    elapsed = time.perf_counter() - start
+    record_rows(table, len(frame))
+
+    print('Wrote {} rows to {} in {:.2f}s ({:.0f} rows/sec).'.format(
+        len(frame), table, elapsed, len(frame) / elapsed if elapsed else float('inf')))
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import record_http
+
+"""
+Concurrent access to the FPL API. All requests go through a single keep-alive session, are spread over a bounded
+thread pool and are throttled by a token bucket so we stay polite to the API. The base url can be overridden with
+the FPL_API_URL environment variable, which lets the collector be pointed at a local stub server.
+"""
+
+API_URL = os.environ.get('FPL_API_URL', 'https://fantasy.premierleague.com/api/')
+MAX_WORKERS = int(os.environ.get('FPL_MAX_WORKERS', 16))
+RATE_LIMIT = float(os.environ.get('FPL_RATE_LIMIT', 50))
+MAX_RETRIES = int(os.environ.get('FPL_MAX_RETRIES', 3))
+
+# status codes worth retrying - anything else is treated as a permanent failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """ Thread safe token bucket limiting the rate at which requests are sent.
+    Args:
+        rate: number of tokens added per second, a rate of 0 disables the limit
+        capacity: maximum number of tokens that can be saved up for a burst, defaults to rate
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Block until a token is available and take it """
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchError(Exception):
+    """ Raised when a request has failed permanently or run out of retries """
+
+
+class Fetcher:
+    """ Fetches json from the FPL API over a pooled session with retries, backoff and rate limiting.
+    Args:
+        api_url: base url of the API, ending in a slash
+        max_workers: maximum number of requests in flight at once
+        rate: maximum number of requests per second
+        max_retries: number of times a failed request is retried before giving up
+        backoff: base delay in seconds, doubled after each failed attempt
+        timeout: timeout in seconds for a single request
+    """
+
+    def __init__(self,
+                 api_url: str = API_URL,
+                 max_workers: int = MAX_WORKERS,
+                 rate: float = RATE_LIMIT,
+                 max_retries: int = MAX_RETRIES,
+                 backoff: float = 0.5,
+                 timeout: float = 10):
+
+        self.api_url = api_url
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+
+        # size the connection pool to the number of workers so every thread can keep its connection alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path: str, **kwargs):
+        """ GET a path relative to the API url, retrying connection errors and retryable status codes """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(self.api_url + path, timeout=self.timeout, **kwargs)
+            except requests.RequestException as error:
+                record_http(time.perf_counter() - start, ok=False)
+                reason = repr(error)
+            else:
+                record_http(time.perf_counter() - start, ok=response.status_code < 400)
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code >= 400:
+                        raise FetchError('{} returned status {}'.format(path, response.status_code))
+                    return response
+                reason = 'status {}'.format(response.status_code)
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        raise FetchError('{} failed after {} attempts: {}'.format(path, self.max_retries + 1, reason))
+
+    def get_json(self, path: str):
+        try:
+            return self.get(path).json()
+        except ValueError as error:
+            raise FetchError('{} returned invalid json: {}'.format(path, error))
+
+    def fetch_all(self, paths: list):
+        """ Fetch json for every path concurrently.
+        Returns a list of results in the same order as paths (None where the request failed) and a dict
+        mapping the position of each failed path to the reason it failed. """
+
+        results = [None] * len(paths)
+        failures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.get_json, path) for path in paths]
+            for i, future in enumerate(futures):
+                try:
+                    results[i] = future.result()
+                except FetchError as error:
+                    failures[i] = str(error)
+
+        return results, failures
+
+    def element_summaries(self, player_ids: list):
+        """ Fetch the element-summary of every player id. Returns the summaries in the order of player_ids
+        and a dict mapping failed player ids to the reason they failed. """
+
+        paths = ['element-summary/{}/'.format(player_id) for player_id in player_ids]
+        results, failures = self.fetch_all(paths)
+        return results, {player_ids[i]: reason for i, reason in failures.items()}
@@ -1,19 +1,20 @@
-import requests
-import pandas as pd
-import json
 import sqlalchemy as db
 import os
+from bootstrap import BootstrapSnapshot
+from db_writer import write_frame
+from metrics import instrument, checkpoint
 
-def get_player_info(db_uri=os.environ.get('POSTGRES')):
-    # Retrieve info from Bootstrap page
+@instrument('get_player_info')
+def get_player_info(db_uri=os.environ.get('POSTGRES'), snapshot=None):
+    # Retrieve info from Bootstrap page, reusing the snapshot already fetched this run if there is one
     print('Getting player info...')
-    bootstrap_request = requests.get("https://fantasy.premierleague.com/api/bootstrap-static/")
-    request_json = bootstrap_request.json()
+    owns_snapshot = snapshot is None
+    if owns_snapshot:
+        snapshot = BootstrapSnapshot()
 
     # Extract player and team info from bootstrap request ready for consolidation
-    players = pd.read_json(json.dumps(request_json["elements"]))[['id', 'first_name', 
-    'second_name', 'team', 'now_cost', 'element_type', 'status']]
-    teams = pd.read_json(json.dumps(request_json["teams"]))[['id', 'name', 'short_name']]
+    players = snapshot.elements[['id', 'first_name', 'second_name', 'team', 'now_cost', 'element_type', 'status']]
+    teams = snapshot.teams[['id', 'name', 'short_name']]
 
     # Rename the columns of teams so it doesn't clash with any players columns
     teams = teams.rename(columns={'id': 'team', 'name': 'team_name', 'short_name': 'team_short_name'})
@@ -41,10 +42,17 @@ def get_player_info(db_uri=os.environ.get('POSTGRES')):
 
     # Set player id to the index ready for writing to DB
     players.set_index('id', inplace=True)
+    checkpoint('prepare player info')
 
-    # Connect to DB with UTF8 encoding as a parameter
-    engine = db.create_engine(db_uri, client_encoding='utf8')
+    # Connect to DB with UTF8 encoding as a parameter, which only PostgreSQL takes
+    engine = db.create_engine(db_uri, **({'client_encoding': 'utf8'} if db_uri.startswith('postgres') else {}))
 
-    # Dump player info to DB
-    players.to_sql('player_info', con=engine, if_exists='replace')
-    print('Player info successfully added to database.')
\ No newline at end of file
+    # Dump player info to DB, replacing the table in one transaction
+    with engine.begin() as connection:
+        write_frame(players, 'player_info', connection, if_exists='replace')
+    checkpoint('database write')
+    print('Player info successfully added to database.')
+
+    # a snapshot fetched here is stored for the next run, a shared one is left to its owner
+    if owns_snapshot:
+        snapshot.commit()
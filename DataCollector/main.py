@@ -1,13 +1,29 @@
+import os
+import sqlalchemy as db
 from data_collection import data_collection
 from get_player_info import get_player_info
+from bootstrap import BootstrapSnapshot
+from metrics import instrument, checkpoint
 
+@instrument('collector')
 def handler(event, context):
 
+    # Fetch the bootstrap data once for both collectors, revalidating the copy cached by the last run
+    snapshot = BootstrapSnapshot().load()
+    checkpoint('bootstrap')
+
     # Do the data collection step
-    data_collection()
+    data_collection(snapshot=snapshot)
+
+    # Do player info collection, player info only depends on the bootstrap data so skip it if nothing changed,
+    # unless the table is missing
+    if snapshot.modified or not db.create_engine(os.environ.get('POSTGRES')).has_table('player_info'):
+        get_player_info(snapshot=snapshot)
+    else:
+        print('Bootstrap data unchanged, player info is already up to date.')
 
-    # Do player info collection
-    get_player_info()
+    # Both collectors succeeded, so the next run can revalidate against this payload
+    snapshot.commit()
 
     return {
         'status_code': 200,
@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+
+"""
+Lightweight performance instrumentation for the Lambda handlers. A handler decorated with instrument() records the
+wall time of each stage between checkpoint() calls, the count and latency percentiles of HTTP requests, rows read
+and written per table, payload bytes and peak memory, and emits them as one JSON line when it returns. Setting
+FPL_PROFILE_DIR also dumps a cProfile of the handler to that directory.
+
+Nothing is recorded unless FPL_METRICS or FPL_PROFILE_DIR is set: instrument() then returns the handler unchanged
+and the other functions return straight away, so the instrumentation costs next to nothing when it is disabled.
+The same file is kept in both the DataCollector and Modelling directories, as each is deployed on its own.
+"""
+
+ENABLED = os.environ.get('FPL_METRICS', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('FPL_PROFILE_DIR')
+# file the JSON metrics are appended to, as well as being printed
+METRICS_PATH = os.environ.get('FPL_METRICS_PATH')
+
+# the instrumented handlers currently running, innermost last
+_runs = []
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Run:
+    """ Metrics of one instrumented handler. Handlers instrumented inside another record their stages into the
+    outer handler's run, prefixed with their name. """
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.prefix = parent.prefix + name + '/' if parent else ''
+        self.root = parent.root if parent else self
+        self.start = self.last = time.perf_counter()
+        if parent is None:
+            self.stages = {}
+            # (seconds, ok) of every request, appending to a list is safe from any thread
+            self.http_requests = []
+            self.rows_read = {}
+            self.rows_written = {}
+            self.bytes = {}
+
+    def checkpoint(self, stage):
+        now = time.perf_counter()
+        self.root.stages[self.prefix + stage] = {'seconds': round(now - self.last, 6), 'peak_rss_mb': _peak_rss_mb()}
+        self.last = now
+
+    def summary(self):
+        latencies = sorted(seconds for seconds, _ in self.http_requests)
+        http = {'requests': len(latencies), 'errors': sum(not ok for _, ok in self.http_requests)}
+        if latencies:
+            http.update({'p50_ms': 1000 * _percentile(latencies, 0.5), 'p90_ms': 1000 * _percentile(latencies, 0.9),
+                         'p99_ms': 1000 * _percentile(latencies, 0.99), 'max_ms': 1000 * latencies[-1]})
+        return {
+            'run': self.name,
+            'seconds': round(time.perf_counter() - self.start, 6),
+            'stages': self.stages,
+            'http': http,
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'bytes': self.bytes,
+            'peak_rss_mb': _peak_rss_mb()
+        }
+
+
+def _emit(summary):
+    line = json.dumps({'metrics': summary})
+    print(line)
+    if METRICS_PATH:
+        with open(METRICS_PATH, 'a') as f:
+            f.write(line + '\n')
+
+
+def instrument(name):
+    """ Decorator recording the metrics of every call of a handler, see the module docstring """
+
+    def decorator(function):
+        if not (ENABLED or PROFILE_DIR):
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            run = Run(name, _runs[-1] if _runs else None)
+            profile = cProfile.Profile() if PROFILE_DIR and len(_runs) == 0 else None
+            _runs.append(run)
+            if profile:
+                profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profile:
+                    profile.disable()
+                    os.makedirs(PROFILE_DIR, exist_ok=True)
+                    profile.dump_stats(os.path.join(PROFILE_DIR, '{}-{}.prof'.format(name, int(time.time()))))
+                _runs.pop()
+                if run.root is run:
+                    if ENABLED:
+                        _emit(run.summary())
+                else:
+                    # the inner handler counts as one stage of the outer one
+                    _runs[-1].checkpoint(name)
+
+        return wrapper
+
+    return decorator
+
+
+def checkpoint(stage):
+    """ Close the stage that has run since the last checkpoint, or since the handler started, under the given name """
+    if _runs:
+        _runs[-1].checkpoint(stage)
+
+
+def record_http(seconds, ok=True):
+    """ Record the latency of one HTTP request, which may be made from any thread """
+    if _runs:
+        _runs[-1].root.http_requests.append((seconds, ok))
+
+
+def record_rows(table, rows, written=True):
+    """ Record rows written to, or read from, a table """
+    if _runs:
+        root = _runs[-1].root
+        counts = root.rows_written if written else root.rows_read
+        counts[table] = counts.get(table, 0) + rows
+
+
+def record_bytes(name, size):
+    """ Record the size in bytes of a payload """
+    if _runs:
+        root = _runs[-1].root
+        root.bytes[name] = root.bytes.get(name, 0) + size
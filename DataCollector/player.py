@@ -1,11 +1,13 @@
 import requests
+from fetcher import API_URL
 
 class Player:
 
-    def __init__(self, player_id):
+    def __init__(self, player_id, player_data=None):
         self.player_id = player_id
-        player_data = requests.get("https://fantasy.premierleague.com/api/element-summary/{}/".format(
-            self.player_id)).json()
+        # the element summary can be passed in when it has already been fetched, otherwise request it here
+        if player_data is None:
+            player_data = requests.get("{}element-summary/{}/".format(API_URL, self.player_id)).json()
         self.fixtures = player_data['fixtures'][0]
         try: 
             self.history = player_data['history'][-1]
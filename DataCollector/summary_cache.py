@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+from bootstrap import CACHE_DIR
+
+"""
+Most players' element summaries do not change between collection runs. SummaryCache keeps the last fetched element
+summary of every player together with a fingerprint of the bootstrap fields that drive it, so only players whose
+fingerprint has changed need to be requested again. The fingerprint also covers the schedule of gameweeks still to
+come, so a rescheduled deadline refetches everyone's upcoming fixtures, and the unfinished fixtures of the player's
+team from the fixtures/ endpoint, so a postponed fixture or one moved into another gameweek refetches the players of
+both its teams even when no deadline changes.
+"""
+
+# bootstrap fields which change whenever a player's element summary does
+FINGERPRINT_FIELDS = ['form', 'points_per_game', 'ict_index', 'chance_of_playing_this_round', 'total_points',
+                      'minutes', 'team']
+
+
+def schedule_fingerprint(events: list):
+    """ Hash the ids and deadlines of the bootstrap events still to be played, which fix the upcoming fixtures and
+    their home/away flags and difficulties in every player's element summary """
+    values = [(event['id'], event['deadline_time']) for event in events if not event.get('finished')]
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def team_fixtures_fingerprints(fixtures: list):
+    """ Hash the fixtures/ payload's unfinished fixtures of each team, with their gameweek, kickoff time, home/away
+    flag and difficulty, returning the hashes keyed by team id """
+    team_fixtures = {}
+    for fixture in sorted(fixtures, key=lambda fixture: fixture['id']):
+        if fixture.get('finished'):
+            continue
+        values = [fixture['id'], fixture['event'], fixture['kickoff_time']]
+        team_fixtures.setdefault(fixture['team_h'], []).append(values + [True, fixture['team_h_difficulty']])
+        team_fixtures.setdefault(fixture['team_a'], []).append(values + [False, fixture['team_a_difficulty']])
+    return {team: hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+            for team, values in team_fixtures.items()}
+
+
+def fingerprint(player: dict, current_event: int, schedule: str = None, team_fixtures: dict = None):
+    """ Hash the fields of a bootstrap player dict that drive its element summary, along with the current event,
+    the schedule_fingerprint of the events and the hash of the player's team's fixtures from
+    team_fixtures_fingerprints """
+    team_fixture = team_fixtures.get(player.get('team')) if team_fixtures is not None else None
+    values = [player.get(field) for field in FINGERPRINT_FIELDS] + [current_event, schedule, team_fixture]
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+
+class SummaryCache:
+    """ On disk store of the last fetched element summary of each player, keyed by player id.
+    Args:
+        cache_dir: directory the cache file is stored in
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.path = os.path.join(cache_dir, 'element-summaries.json')
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, player_id, player_fingerprint: str):
+        """ Return the stored summary if its fingerprint still matches, otherwise None """
+        entry = self.entries.get(str(player_id))
+        if entry is not None and entry['fingerprint'] == player_fingerprint:
+            self.hits += 1
+            return entry['summary']
+        self.misses += 1
+        return None
+
+    def put(self, player_id, player_fingerprint: str, summary: dict):
+        self.entries[str(player_id)] = {'fingerprint': player_fingerprint, 'summary': summary}
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        print('Served {} of {} element summaries from cache ({:.0%} hit rate), {} requests made.'.format(
+            self.hits, total, hit_rate, self.misses))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,131 @@
+import io
+import os
+import glob
+import json
+import hashlib
+import joblib
+import numpy as np
+
+"""
+Fitted pipelines are saved as versioned artifacts, named by a hash of their hyperparameters and the number of
+training rows they were fitted on, along with the entry ids of those rows. A later run with the same hyperparameters
+only has to update the newest artifact with the rows it has not seen, rather than fit a new model on all of history.
+
+The modelling function runs weekly, so on Lambda it almost always starts in a new container whose /tmp is empty.
+Warm starts therefore need ARTIFACT_DIR to outlive the container: either an S3 location ('s3://bucket/prefix') or a
+persistent volume such as an EFS mount. Left in /tmp, every cold start fits a new model from scratch.
+"""
+
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', '/tmp/model_artifacts')
+# number of trees added to the forest for each batch of new rows
+WARM_START_TREES = int(os.environ.get('WARM_START_TREES', 10))
+# once the forest has grown past this many trees the model is refitted from scratch
+MAX_TREES = int(os.environ.get('MAX_TREES', 300))
+# number of artifacts kept per set of hyperparameters
+KEEP_ARTIFACTS = 2
+
+
+def hyperparameter_hash(hyperparameters):
+    return hashlib.sha1(json.dumps(hyperparameters, sort_keys=True, default=int).encode()).hexdigest()[:12]
+
+
+class ArtifactStore:
+    """ Directory or S3 location of fitted pipelines keyed by hyperparameters and training data high-water mark.
+    Args:
+        artifact_dir: S3 location or directory the artifacts are saved in
+    """
+
+    def __init__(self, artifact_dir: str = ARTIFACT_DIR):
+        self.artifact_dir = artifact_dir
+        self.s3 = None
+        if artifact_dir.startswith('s3://'):
+            import boto3
+            self.s3 = boto3.client('s3')
+            self.bucket, _, prefix = artifact_dir[len('s3://'):].partition('/')
+            self.prefix = prefix.rstrip('/') + '/' if prefix.strip('/') else ''
+
+    def _name(self, hyperparameters, entry_ids):
+        return 'model-{}-{:010d}-{}.joblib'.format(
+            hyperparameter_hash(hyperparameters), len(entry_ids), int(entry_ids.max()) if len(entry_ids) else 0)
+
+    def _paths(self, hyperparameters):
+        """ Paths, or S3 keys, of the artifacts with these hyperparameters, oldest first """
+        name = 'model-{}-'.format(hyperparameter_hash(hyperparameters))
+        if self.s3 is None:
+            return sorted(glob.glob(os.path.join(self.artifact_dir, name + '*.joblib')))
+        pages = self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix + name)
+        return sorted(item['Key'] for page in pages for item in page.get('Contents', []))
+
+    def save(self, pipe, hyperparameters, entry_ids):
+        """ Save a fitted pipeline along with the entry ids of the rows it was fitted on, removing old versions """
+        artifact = {'pipeline': pipe, 'hyperparameters': hyperparameters, 'entry_ids': np.asarray(entry_ids)}
+        if self.s3 is None:
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            path = os.path.join(self.artifact_dir, self._name(hyperparameters, entry_ids))
+            joblib.dump(artifact, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        else:
+            path = self.prefix + self._name(hyperparameters, entry_ids)
+            buffer = io.BytesIO()
+            joblib.dump(artifact, buffer)
+            self.s3.put_object(Bucket=self.bucket, Key=path, Body=buffer.getvalue())
+
+        for old_path in self._paths(hyperparameters)[:-KEEP_ARTIFACTS]:
+            if self.s3 is None:
+                os.remove(old_path)
+            else:
+                self.s3.delete_object(Bucket=self.bucket, Key=old_path)
+        return path
+
+    def latest(self, hyperparameters):
+        """ Return the pipeline fitted on the most rows with these hyperparameters and the entry ids of those rows,
+        or (None, None) if there is none """
+        paths = self._paths(hyperparameters)
+        if not paths:
+            return None, None
+        if self.s3 is None:
+            artifact = joblib.load(paths[-1])
+        else:
+            artifact = joblib.load(io.BytesIO(self.s3.get_object(Bucket=self.bucket, Key=paths[-1])['Body'].read()))
+        return artifact['pipeline'], artifact['entry_ids']
+
+
+def fit_or_update(make_pipeline, X, y, entry_ids, hyperparameters, store=None):
+    """
+    Return a pipeline fitted on X, y, reusing the latest artifact where possible:
+        - if no rows are new, the cached pipeline is returned as it is
+        - if some rows are new, the cached scaler is kept and the forest grows WARM_START_TREES trees on the new rows
+        - if there is no artifact, or the forest has grown past MAX_TREES, a new pipeline is fitted from scratch
+    Args:
+        make_pipeline: function returning a new, unfitted pipeline
+        X, y: training data as arrays
+        entry_ids: entry id of each row of X
+        hyperparameters: dict of hyperparameters, part of the artifact key
+        store: ArtifactStore, a default one is created if not given
+    """
+
+    if store is None:
+        store = ArtifactStore()
+    entry_ids = np.asarray(entry_ids)
+
+    pipe, fitted_entry_ids = store.latest(hyperparameters)
+    if pipe is not None:
+        new = ~np.isin(entry_ids, fitted_entry_ids)
+        regressor = pipe.named_steps['regressor']
+
+        if not new.any():
+            print('No new training rows since the last fit, reusing the saved model.')
+            return pipe
+
+        # forests count their trees, boosting models their iterations
+        trees = regressor.reg_.n_estimators if hasattr(regressor.reg_, 'estimators_') else regressor.reg_.n_iter_
+        if trees + WARM_START_TREES <= MAX_TREES:
+            print('Updating the saved model with {} new training rows.'.format(new.sum()))
+            regressor.grow(pipe.named_steps['scaler'].transform(X), y, new, n_estimators=WARM_START_TREES)
+            store.save(pipe, hyperparameters, entry_ids)
+            return pipe
+
+    print('Fitting a new model on {} training rows.'.format(len(X)))
+    pipe = make_pipeline().fit(X, y)
+    store.save(pipe, hyperparameters, entry_ids)
+    return pipe
@@ -0,0 +1,129 @@
+import os
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from scipy.stats import spearmanr
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from custom_regressor import CustomRegressor
+from feature_store import FeatureStore
+from rolling_features import add_rolling_features
+from feature_schema import KEY_COLUMNS, apply_schema
+from schema import check_schema
+
+"""
+Walk-forward backtest of the model. Every past gameweek g is predicted by a model trained only on the gameweeks
+before it, and scored on RMSE, rank correlation and the share of the best possible top-N points captured. Gameweeks
+are fanned out over a process pool, and the feature matrix is written once to .npy files which every worker memory
+maps, so it is never pickled and sent to the workers.
+"""
+
+# shared arrays, memory mapped once per worker process
+_X = _y = _gameweeks = None
+
+
+def load_training_data(engine):
+    """ The training rows as used by the modelling functions, with the gameweek of each row numbered in order
+    across seasons, and the season and gameweek of each number """
+    check_schema(engine)
+    store = FeatureStore().sync(engine)
+    features, response = store.frame(), store.response()
+    history = store.history()
+    if history is not None:
+        features = add_rolling_features(features, history)
+
+    features['chance_of_playing'] = features['chance_of_playing'].fillna(100)
+    features = apply_schema(features.fillna(0))
+    df = features.join(response, how='inner')
+
+    # number the gameweeks in order across seasons
+    by_gameweek = df.groupby(['season', 'gameweek'])
+    gameweeks = by_gameweek.ngroup().values
+    labels = pd.DataFrame(sorted(by_gameweek.groups), columns=['season', 'gameweek'])
+    df = df.drop(columns=KEY_COLUMNS)
+    return df.iloc[:, :-1].values, df.iloc[:, -1].values, gameweeks, labels
+
+
+def _init_worker(data_dir):
+    global _X, _y, _gameweeks
+    _X = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
+    _y = np.load(os.path.join(data_dir, 'y.npy'), mmap_mode='r')
+    _gameweeks = np.load(os.path.join(data_dir, 'gameweeks.npy'), mmap_mode='r')
+
+
+def _backtest_gameweek(gameweek, reg_params, top_n):
+    """ Train on every gameweek before this one, predict this one and score the predictions """
+    train, test = _gameweeks < gameweek, _gameweeks == gameweek
+
+    pipe = Pipeline([
+        ('scaler', StandardScaler()),
+        ('regressor', CustomRegressor(reg_params=reg_params))
+    ])
+    pipe.fit(_X[train], _y[train])
+    predicted, actual = pipe.predict(_X[test]), np.asarray(_y[test])
+
+    best_possible = np.sort(actual)[::-1][:top_n].sum()
+    captured = actual[np.argsort(predicted)[::-1][:top_n]].sum()
+
+    return {
+        'gameweek': int(gameweek),
+        'n_train': int(train.sum()),
+        'n_test': int(test.sum()),
+        'rmse': float(np.sqrt(np.mean((predicted - actual) ** 2))),
+        'rank_correlation': float(spearmanr(predicted, actual).correlation),
+        'top_n_captured': float(captured / best_possible) if best_possible else np.nan
+    }
+
+
+def backtest(X, y, gameweeks, reg_params=None, min_train_gameweeks=3, top_n=20, max_workers=None):
+    """
+    Run the walk-forward backtest over every gameweek with at least min_train_gameweeks gameweeks before it.
+    Args:
+        X, y: training rows and response
+        gameweeks: gameweek number of each row, counting up from 0
+        reg_params: parameters for the regression sub-model of CustomRegressor
+        min_train_gameweeks: number of gameweeks to train on before the first backtested gameweek
+        top_n: number of top predicted players the captured points are measured over
+        max_workers: number of worker processes, defaults to the number of cores
+    Returns a dataframe with one row of scores per gameweek.
+    """
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        np.save(os.path.join(data_dir, 'X.npy'), np.ascontiguousarray(X, dtype=np.float32))
+        np.save(os.path.join(data_dir, 'y.npy'), np.ascontiguousarray(y, dtype=np.float32))
+        np.save(os.path.join(data_dir, 'gameweeks.npy'), np.ascontiguousarray(gameweeks))
+
+        to_test = np.unique(gameweeks)[min_train_gameweeks:]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data_dir,)) as pool:
+            results = list(pool.map(_backtest_gameweek, to_test,
+                                    [reg_params] * len(to_test), [top_n] * len(to_test)))
+
+    return pd.DataFrame(results).set_index('gameweek')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of the model over every past gameweek')
+    parser.add_argument('--db-uri', default=os.environ.get('POSTGRES'))
+    parser.add_argument('--min-train-gameweeks', type=int, default=3)
+    parser.add_argument('--top-n', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='csv file to write the per gameweek scores to')
+    args = parser.parse_args()
+
+    engine = db.create_engine(args.db_uri)
+    X, y, gameweeks, labels = load_training_data(engine)
+
+    # use the hyperparameters chosen by modelling.py
+    hyperparameters = pd.read_sql('SELECT * FROM hyperparameters', con=engine)
+    reg_params = {column: int(hyperparameters.loc[0, column]) for column in hyperparameters.columns
+                  if column != 'index'}
+
+    results = backtest(X, y, gameweeks, reg_params, args.min_train_gameweeks, args.top_n, args.workers)
+    results = results.join(labels)
+    print(results)
+    print(results[['rmse', 'rank_correlation', 'top_n_captured']].mean())
+    if args.output:
+        results.to_csv(args.output)
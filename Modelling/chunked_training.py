@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from custom_regressor import CustomRegressor
+from rolling_features import rolling_features, join_rolling_features, load_history
+from feature_schema import KEY_COLUMNS, apply_schema
+from queries import TRAINING_QUERY
+from schema import check_schema
+
+"""
+Trains the model from chunks of the training rows rather than the whole history at once. Chunks are read either from
+the feature store, as slices of its memory mapped files, or from the database with read_sql chunks, and each chunk
+is converted to float32 as it is read, so the full history is never held in memory, let alone as float64. The
+rolling history features are computed once and joined to each chunk. Training makes two passes over the chunks: the
+first fits the scaler incrementally, the second warm starts the regressor on each scaled chunk in turn.
+
+`python chunked_training.py train` fits a model this way from the database and saves it, optionally writing its
+predictions for the next gameweek, and `python chunked_training.py benchmark` compares it with the random forest.
+"""
+
+# training rows per chunk
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 50000))
+
+
+def prepare_rolling(history):
+    """ The rolling features of the history table sorted by kickoff time, ready to be joined to every chunk, or None
+    if there is no history """
+    if history is None:
+        return None
+    return rolling_features(history).sort_values('kickoff_time', ignore_index=True)
+
+
+def prepare_features(features, rolling=None):
+    """ Prepare features the same way as the modelling functions, as a float32 dataframe without the columns
+    identifying each row. features must include the player_id and timestamp columns. """
+
+    if rolling is not None:
+        features = join_rolling_features(features, rolling)
+    features = features.drop(columns=['status'], errors='ignore')
+    features['chance_of_playing'] = features['chance_of_playing'].fillna(100)
+    features = apply_schema(features.fillna(0)).drop(columns=KEY_COLUMNS, errors='ignore')
+    return features.astype(np.float32)
+
+
+def prepare_chunk(features, response, rolling=None):
+    """ Prepare a chunk of the features and response, returning the features as a float32 dataframe and the
+    response as a float32 array, for the rows where both are present """
+
+    X = prepare_features(features, rolling).join(response, how='inner')
+    return X.drop(columns=[response.name]), X.pop(response.name).to_numpy(dtype=np.float32)
+
+
+def store_chunks(store, chunk_size=CHUNK_SIZE, rolling=None):
+    """ Yield (X, y) chunks of the training rows from slices of a synced FeatureStore's memory mapped files, so only
+    one chunk of rows is ever read into memory """
+
+    matrix, entry_ids, timestamps = store.matrix(), store.entry_ids(), store.timestamps()
+    columns = store.meta['columns']
+    for start in range(0, len(matrix), chunk_size):
+        values = np.asarray(matrix[start:start + chunk_size])
+        # points_scored is always the last column, blank until the response is known
+        known = ~np.isnan(values[:, -1])
+        if not known.any():
+            continue
+        chunk = pd.DataFrame(values[known], columns=columns,
+                             index=pd.Index(entry_ids[start:start + chunk_size][known], name='entry_id'))
+        chunk['timestamp'] = timestamps[start:start + chunk_size][known]
+        chunk = apply_schema(chunk)
+        yield prepare_chunk(chunk.drop(columns=[columns[-1]]), chunk[columns[-1]], rolling)
+
+
+def sql_chunks(engine, chunk_size=CHUNK_SIZE, rolling=None):
+    """ Yield (X, y) chunks of the training rows read straight from the features and response tables """
+
+    for chunk in pd.read_sql(db.text(TRAINING_QUERY), engine, index_col='entry_id', parse_dates=['timestamp'],
+                             chunksize=chunk_size):
+        yield prepare_chunk(chunk.drop(columns=['points_scored']), chunk['points_scored'], rolling)
+
+
+def fit_chunked(make_chunks, reg_params=None, reg_name='hist_gbm', clf_name='hist_gbm_classifier'):
+    """
+    Fit a scaler and CustomRegressor pipeline from chunks of the training rows.
+    Args:
+        make_chunks: function taking no arguments which returns a new iterable of (X, y) chunks, called once per pass
+        reg_params: parameters for the regression sub-model of CustomRegressor, whose number of trees or boosting
+            iterations is spread across the chunks
+        reg_name, clf_name: estimators for the regression and classification sub-models
+    Returns the fitted pipeline.
+    """
+
+    scaler = StandardScaler()
+    n_chunks = 0
+    for X, _ in make_chunks():
+        scaler.partial_fit(X)
+        n_chunks += 1
+
+    regressor = CustomRegressor(reg_params=reg_params, reg_name=reg_name, clf_name=clf_name)
+    regressor.fit_chunked(((scaler.transform(X).astype(np.float32), y) for X, y in make_chunks()), n_chunks)
+
+    return Pipeline([('scaler', scaler), ('regressor', regressor)])
+
+
+def _synthetic_data(n_rows, n_features=40, seed=0):
+    rng = np.random.default_rng(seed)
+    X = (rng.random((n_rows, n_features)) * 10).astype(np.float32)
+    y = np.where(X[:, 2] > 3, X[:, 0] + X[:, 1] * X[:, 3] / 10 + rng.normal(size=n_rows), 0).astype(np.float32)
+    return X, y
+
+
+def _measure(backend, n_rows, chunk_size):
+    """ Fit one backend on synthetic data and print its fit time and peak RSS as JSON, run in a fresh process """
+    import resource
+
+    if backend == 'forest':
+        X, y = _synthetic_data(n_rows)
+        X = X.astype(np.float64)
+        pipe = Pipeline([('scaler', StandardScaler()), ('regressor', CustomRegressor())])
+        start = time.perf_counter()
+        pipe.fit(X, y)
+        trees = len(pipe.named_steps['regressor'].reg_.estimators_)
+    else:
+        chunks = [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+        def make_chunks():
+            for i, (first, last) in enumerate(chunks):
+                yield _synthetic_data(last - first, seed=i)
+
+        # the same number of boosting iterations at most as the forest has trees, whatever the number of chunks
+        start = time.perf_counter()
+        pipe = fit_chunked(make_chunks, reg_params={'max_iter': 100})
+        trees = pipe.named_steps['regressor'].reg_.n_iter_
+
+    fit_time = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'backend': backend, 'rows': n_rows, 'trees': int(trees), 'fit_seconds': fit_time,
+                      'peak_rss_mb': peak_rss}))
+
+
+def benchmark(base_rows=20000, scales=(1, 5, 20), chunk_size=CHUNK_SIZE):
+    """ Compare fit time and peak RSS of the random forest against chunked histogram gradient boosting at multiples
+    of today's training set size. Each fit runs in its own process so the peak RSS of one does not hide another's. """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for scale in scales:
+        for backend in ('forest', 'hist_gbm'):
+            code = 'import chunked_training; chunked_training._measure({!r}, {}, {})'.format(
+                backend, base_rows * scale, chunk_size)
+            output = subprocess.run([sys.executable, '-c', code], cwd=here, check=True,
+                                    capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print('{}x ({} rows), {} with {} trees: {:.2f}s, peak RSS {:.0f}MB'.format(
+                scale, result['rows'], backend, result['trees'], result['fit_seconds'], result['peak_rss_mb']))
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def train(db_uri, output, source='store', chunk_size=CHUNK_SIZE, reg_name='hist_gbm', n_estimators=None,
+          predict=False):
+    """ Fit a model from chunks of the training rows in the database, read through the feature store or straight
+    from the tables, and save it to output with joblib. n_estimators is the total number of trees or boosting
+    iterations, the estimator's default if not given. With predict, also write its predictions for the next
+    gameweek to the predictions table. Returns the fitted pipeline. """
+
+    import joblib
+    from feature_store import FeatureStore
+    from queries import prediction_rows
+    from invoke_data_modelling import write_predictions
+
+    engine = db.create_engine(db_uri)
+    check_schema(engine)
+    if source == 'store':
+        store = FeatureStore().sync(engine)
+        rolling = prepare_rolling(store.history())
+        make_chunks = lambda: store_chunks(store, chunk_size, rolling)
+    else:
+        rolling = prepare_rolling(load_history(engine))
+        make_chunks = lambda: sql_chunks(engine, chunk_size, rolling)
+
+    start = time.perf_counter()
+    reg_params = None
+    if n_estimators is not None:
+        reg_params = {'max_iter' if reg_name == 'hist_gbm' else 'n_estimators': n_estimators}
+    pipe = fit_chunked(make_chunks, reg_params=reg_params, reg_name=reg_name)
+    print('Fitted chunked {} model in {:.2f}s.'.format(reg_name, time.perf_counter() - start))
+    joblib.dump(pipe, output)
+
+    if predict:
+        latest = prediction_rows(engine)
+        # the scaler was fitted on dataframes, so it knows the training columns and their order
+        X_new = prepare_features(latest, rolling)[pipe.named_steps['scaler'].feature_names_in_]
+        write_predictions(engine, list(pipe.predict(X_new)), list(latest['player_id'].values))
+
+    return pipe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the model from chunks of the training rows')
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_parser = commands.add_parser('train', help='fit a model from the database and save it')
+    train_parser.add_argument('--db-uri', default=os.environ.get('POSTGRES'))
+    train_parser.add_argument('--output', default='chunked_model.joblib')
+    train_parser.add_argument('--source', choices=['store', 'sql'], default='store',
+                              help='read the chunks from the feature store or straight from the database')
+    train_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    train_parser.add_argument('--reg-name', default='hist_gbm')
+    train_parser.add_argument('--n-estimators', type=int, default=None,
+                              help='trees or boosting iterations in total, spread across the chunks')
+    train_parser.add_argument('--predict', action='store_true', help='also write predictions for the next gameweek')
+    benchmark_parser = commands.add_parser('benchmark', help='compare fit time and memory with the random forest')
+    benchmark_parser.add_argument('--base-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train(args.db_uri, args.output, args.source, args.chunk_size, args.reg_name, args.n_estimators, args.predict)
+    else:
+        benchmark(args.base_rows)
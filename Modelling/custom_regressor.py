@@ -1,6 +1,6 @@
 from typing import Optional, Union
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor, HistGradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.base import BaseEstimator
 from sklearn.utils.estimator_checks import check_estimator
@@ -13,8 +13,8 @@ class CustomRegressor(BaseEstimator):
             2) continuous regression
     Implementeted as a valid sklearn estimator, so it can be used in pipelines and GridSearch objects.
     Args:
-        clf_name: currently supports either 'logistic' or 'LGBMClassifier'
-        reg_name: currently supports either 'linear' or 'LGBMRegressor'
+        clf_name: currently supports either 'logistic' or 'hist_gbm_classifier'
+        reg_name: currently supports either 'linear' (a random forest) or 'hist_gbm'
         clf_params: dict of parameters to pass to classifier sub-model when initialized
         reg_params: dict of parameters to pass to regression sub-model when initialized
     """
@@ -37,10 +37,27 @@ class CustomRegressor(BaseEstimator):
         must pass equality test, and instantiated sub-estimators are not equal. """
 
         funcs = {'linear': RandomForestRegressor(n_estimators=100, random_state=0),
-                 'logistic': LogisticRegression(random_state=0)}
+                 'logistic': LogisticRegression(random_state=0),
+                 'hist_gbm': HistGradientBoostingRegressor(early_stopping=True, random_state=0),
+                 'hist_gbm_classifier': HistGradientBoostingClassifier(early_stopping=True, random_state=0)}
 
         return funcs[func_name]
 
+    @staticmethod
+    def _size_param(estimator):
+        """ Name of the parameter setting the number of trees of a forest, or the boosting iterations """
+        return 'n_estimators' if 'n_estimators' in estimator.get_params() else 'max_iter'
+
+    @staticmethod
+    def _extend_estimator(estimator, n_estimators: int):
+        """ Set up a fitted forest or boosting model to add n_estimators trees, or boosting iterations, the next
+        time it is fitted """
+        if 'n_estimators' in estimator.get_params():
+            estimator.set_params(warm_start=True, n_estimators=estimator.n_estimators + n_estimators)
+        else:
+            estimator.set_params(warm_start=True, max_iter=estimator.n_iter_ + n_estimators)
+        return estimator
+
     def fit(self,
             X: Union[np.ndarray],
             y: Union[np.ndarray]):
@@ -65,6 +82,78 @@ class CustomRegressor(BaseEstimator):
         self.is_fitted_ = True
         return self
 
+    def fit_chunked(self,
+                    chunks,
+                    n_chunks: int = 1):
+        """ Fit the model from an iterable of (X, y) chunks, so the whole training set never has to be held in
+        memory at once. Each chunk is converted to float32. The classifier only sees column 2, so that column is
+        gathered from every chunk and the classifier fitted once at the end, while the regressor is warm started on
+        each chunk in turn. Its number of trees or boosting iterations, from reg_params or the estimator's default,
+        is the total over all the chunks, spread evenly across them, and boosting may still stop early.
+        Args:
+            chunks: iterable of (X, y) pairs
+            n_chunks: number of chunks, used to spread the trees or boosting iterations across them
+        """
+        gate_X, gate_y = [], []
+        self.reg_ = None
+        budget = None
+
+        for i, (X, y) in enumerate(chunks):
+            X, y = check_X_y(X, y, dtype=np.float32,
+                             accept_sparse=False,
+                             accept_large_sparse=False,
+                             force_all_finite='allow-nan')
+            if X.shape[1] < 2:
+                raise ValueError('Cannot fit model when n_features = 1')
+            gate_X.append(X[:, 2])
+            gate_y.append(y > 0)
+
+            if self.reg_ is None:
+                self.reg_ = self._resolve_estimator(self.reg_name)
+                if self.reg_params:
+                    self.reg_.set_params(**self.reg_params)
+                budget = self.reg_.get_params()[self._size_param(self.reg_)]
+            # grow to this chunk's share of the total, at least one more tree or iteration per chunk
+            self.reg_.set_params(warm_start=True, **{self._size_param(self.reg_): max(
+                i + 1, budget * (i + 1) // max(n_chunks, i + 1))})
+            self.reg_.fit(X, y)
+
+        if self.reg_ is None:
+            raise ValueError('Cannot fit model without any chunks')
+
+        self.clf_ = self._resolve_estimator(self.clf_name)
+        if self.clf_params:
+            self.clf_.set_params(**self.clf_params)
+        self.clf_.fit(np.concatenate(gate_X).reshape(-1, 1), np.concatenate(gate_y))
+
+        self.is_fitted_ = True
+        return self
+
+    def grow(self,
+             X: Union[np.ndarray],
+             y: Union[np.ndarray],
+             new: Union[np.ndarray],
+             n_estimators: int = 10):
+        """ Update a fitted model with new rows without refitting it from scratch. The classifier only sees one
+        feature so is cheaply refitted on all rows, while the forest (or boosting model) keeps its trees and grows
+        n_estimators more fitted on the new rows only.
+        Args:
+            X, y: every row the model should now be fitted on
+            new: boolean mask of the rows of X the model has not seen before
+            n_estimators: number of trees to add
+        """
+        X, y = check_X_y(X, y, dtype=None,
+                         accept_sparse=False,
+                         accept_large_sparse=False,
+                         force_all_finite='allow-nan')
+        check_is_fitted(self, 'is_fitted_')
+
+        self.clf_.fit(X[:, 2].reshape(-1, 1), y > 0)
+
+        self._extend_estimator(self.reg_, n_estimators)
+        self.reg_.fit(X[new], y[new])
+        return self
+
     def predict(self, X: Union[np.ndarray]):
         """ Predict combined response using binary classification outcome """
         X = check_array(X, accept_sparse=False, accept_large_sparse=False)
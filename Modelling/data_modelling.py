@@ -1,34 +1,63 @@
-import json
-import numpy as np
+import os
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from custom_regressor import CustomRegressor
+from payload import decode_frame
+from artifacts import ArtifactStore, fit_or_update
+from forest_export import export_pipeline
+from metrics import instrument, checkpoint, record_rows
 
 
-def handler(event, context):
-    # Read data sent to handler
-    X = np.array(event["X"]["data"])
-    y = np.array(event["y"]["data"])
-    hyperparameters = event["hyperparameters"]
-    X_new = np.array(event["X_new"]["data"])
-    
+def fit_and_predict(X, y, X_new, hyperparameters, artifact_dir=None):
+    """ Fit the model to X and y, reusing or updating the saved model in artifact_dir (ARTIFACT_DIR by default) where
+    possible, and return its predictions for X_new. X is a dataframe indexed by entry_id, y and X_new are arrays.
+    This is the whole modelling step, called by the Lambda handler below or directly by the in-process executors in
+    executors.py. """
+
     max_depth = hyperparameters["max_depth"]
     min_samples_leaf = hyperparameters["min_samples_leaf"]
     min_samples_split = hyperparameters["min_samples_split"]
 
     # DATA PIPELINE:
-    pipe = Pipeline([
-        ('scaler', StandardScaler()),
-        ('regressor', CustomRegressor(
-            reg_params={'max_depth':max_depth, 'min_samples_leaf':min_samples_leaf,
-             'min_samples_split':min_samples_split}))
-    ])
+    def make_pipeline():
+        return Pipeline([
+            ('scaler', StandardScaler()),
+            ('regressor', CustomRegressor(
+                reg_params={'max_depth':max_depth, 'min_samples_leaf':min_samples_leaf,
+                 'min_samples_split':min_samples_split}))
+        ])
 
-    # Fit the pipeline to the whole dataset
-    pipe.fit(X, y)
+    # Fit the pipeline to the whole dataset, updating the saved model with any new rows rather than starting again
+    # The saved model is only reused if it was fitted on the same columns
+    artifact_key = dict(hyperparameters, columns=list(X.columns))
+    pipe = fit_or_update(make_pipeline, X.values, y, X.index.values, artifact_key,
+                         ArtifactStore(artifact_dir) if artifact_dir else None)
+    checkpoint('fit')
+
+    # Export the fitted model for the NumPy prediction handler in forest_inference.py if asked to
+    if os.environ.get('FOREST_EXPORT_PATH'):
+        export_pipeline(pipe, os.environ['FOREST_EXPORT_PATH'])
+        checkpoint('export')
 
     # Predict on the new data
     predictions = list(pipe.predict(X_new))
+    checkpoint('predict')
+    return predictions
+
+
+@instrument('data_modelling')
+def handler(event, context):
+    # Read data sent to handler, which may be in the binary or the old json format, deleting any frames passed by
+    # reference as they are only sent for this invocation
+    X = decode_frame(event["X"], delete=True)
+    y = decode_frame(event["y"], delete=True).values
+    hyperparameters = event["hyperparameters"]
+    X_new = decode_frame(event["X_new"], delete=True).values
+    record_rows('X', len(X), written=False)
+    record_rows('X_new', len(X_new), written=False)
+    checkpoint('decode payload')
+
+    predictions = fit_and_predict(X, y, X_new, hyperparameters)
 
     return {
         'statusCode': 200,
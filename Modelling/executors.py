@@ -0,0 +1,110 @@
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from payload import encode_payload
+from metrics import record_bytes
+
+"""
+Backends for running the modelling step, data_modelling.fit_and_predict, on the frames prepared by
+invoke_data_modelling. The in-process and process pool backends call it directly with the frames and NumPy arrays,
+so there is no network hop, second cold start or serialisation of the data beyond pickling it to a worker process.
+The Lambda backend sends the frames in the payload.py wire format to the DataModelling Lambda function, as the
+deployed pipeline always has. The backend is chosen by name with get_executor, defaulting to MODELLING_EXECUTOR.
+"""
+
+MODELLING_EXECUTOR = os.environ.get('MODELLING_EXECUTOR', 'lambda')
+MODELLING_FUNCTION = os.environ.get('MODELLING_FUNCTION',
+                                    'arn:aws:lambda:eu-west-2:388851918592:function:FPLDataModelling')
+
+
+def _fit_and_predict(X, y, X_new, hyperparameters, artifact_dir):
+    # imported here so the Lambda backend does not need the model's dependencies
+    from data_modelling import fit_and_predict
+    # the same arrays the Lambda handler decodes from its payload
+    return fit_and_predict(X, np.asarray(y), np.asarray(X_new), hyperparameters, artifact_dir)
+
+
+class InProcessExecutor:
+    """ Runs the modelling step in the calling process.
+    Args:
+        artifact_dir: directory the fitted models are saved in, ARTIFACT_DIR by default
+    """
+
+    def __init__(self, artifact_dir=None):
+        self.artifact_dir = artifact_dir
+
+    def run(self, X, y, X_new, hyperparameters):
+        return _fit_and_predict(X, y, X_new, hyperparameters, self.artifact_dir)
+
+
+class ProcessPoolModellingExecutor:
+    """ Runs the modelling step in a local worker process, keeping the caller free and its memory small.
+    Args:
+        max_workers: size of the pool, the pool is kept between runs so the worker only imports the model once
+        artifact_dir: directory the fitted models are saved in, ARTIFACT_DIR by default
+    """
+
+    def __init__(self, max_workers=1, artifact_dir=None):
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.artifact_dir = artifact_dir
+
+    def run(self, X, y, X_new, hyperparameters):
+        return self.pool.submit(_fit_and_predict, X, y, X_new, hyperparameters, self.artifact_dir).result()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+class LambdaExecutor:
+    """ Runs the modelling step in the DataModelling Lambda function.
+    Args:
+        function_name: name or ARN of the function to invoke
+    """
+
+    def __init__(self, function_name=MODELLING_FUNCTION):
+        import boto3
+        self.client = boto3.client('lambda')
+        self.function_name = function_name
+
+    def run(self, X, y, X_new, hyperparameters):
+        # Package the data in the compressed binary format, passing frames by reference until it fits the request
+        payload = encode_payload({'hyperparameters': hyperparameters, 'grid': False},
+                                 {'X': X, 'y': y, 'X_new': X_new})
+        record_bytes('invoke payload', len(payload))
+
+        response = self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='RequestResponse',
+            Payload=payload
+        )
+
+        response_payload = response['Payload'].read()
+        record_bytes('invoke response', len(response_payload))
+        return json.loads(response_payload)['predictions']
+
+
+EXECUTORS = {
+    'in_process': InProcessExecutor,
+    'process_pool': ProcessPoolModellingExecutor,
+    'lambda': LambdaExecutor
+}
+
+
+def get_executor(name=MODELLING_EXECUTOR, **options):
+    """ A new modelling executor with the given name, one of EXECUTORS, passing any options to its constructor """
+    if name not in EXECUTORS:
+        raise ValueError('Unknown modelling executor {!r}, expected one of {}'.format(name, ', '.join(EXECUTORS)))
+    return EXECUTORS[name](**options)
+
+
+# executors built by shared_executor, kept for the life of the process
+_shared = {}
+
+
+def shared_executor(name=MODELLING_EXECUTOR):
+    """ The executor with the given name shared by every run in this process, so a warm Lambda container reuses one
+    process pool rather than starting, and leaking, a new one on every invocation """
+    if name not in _shared:
+        _shared[name] = get_executor(name)
+    return _shared[name]
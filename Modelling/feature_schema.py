@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+"""
+The declared column types of the features and response tables. The collector applies the schema before writing to
+the database and the modelling functions apply it again when loading, so every frame uses the smallest types that
+hold its values: int8 for flags, difficulties and percentages, int16 for ids and points, float32 for the bootstrap
+statistics and a categorical for player status. The same file is kept in both the DataCollector and Modelling
+directories, as each is deployed on its own.
+"""
+
+STATUS_CATEGORIES = ['a', 'd', 'i', 'n', 's', 'u']
+STATUS_DTYPE = pd.CategoricalDtype(STATUS_CATEGORIES)
+
+FEATURE_SCHEMA = {
+    'player_id': np.int16,
+    'team_id': np.int16,
+    'ict_index': np.float32,
+    'chance_of_playing': np.int8,
+    'form': np.float32,
+    'points_per_game': np.float32,
+    'previous_points': np.int16,
+    'is_home': np.int8,
+    'next_fixture_difficulty': np.int8,
+    'status': STATUS_DTYPE,
+    'points_scored': np.int16,
+    'season': np.int16,
+    'gameweek': np.int8
+}
+
+# columns which identify a row rather than describe the player, never used as model inputs
+KEY_COLUMNS = ['player_id', 'timestamp', 'season', 'gameweek']
+
+
+def apply_schema(frame, schema=FEATURE_SCHEMA):
+    """
+    Cast the columns of frame named in schema to their declared types, leaving other columns alone. Text columns
+    are parsed as numbers first. Integer columns which still have blanks are held as float32 until the blanks are
+    filled, since NumPy integers cannot hold them.
+    """
+
+    # a shallow copy, so replacing its columns leaves the caller's frame alone
+    frame = frame.copy(deep=False)
+    for column, dtype in schema.items():
+        if column not in frame.columns:
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(dtype)
+            continue
+
+        values = frame[column]
+        if values.dtype == object:
+            values = pd.to_numeric(values, errors='coerce')
+        if np.issubdtype(dtype, np.integer) and values.isna().any():
+            dtype = np.float32
+        frame[column] = values.astype(dtype)
+
+    return frame
+
+
+def apply_series_schema(series, schema=FEATURE_SCHEMA):
+    """ apply_schema for a single named series, such as the response """
+    return apply_schema(series.to_frame(), schema)[series.name]
@@ -0,0 +1,278 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from feature_schema import FEATURE_SCHEMA, apply_schema, apply_series_schema
+from rolling_features import HISTORY_COLUMNS
+from metrics import record_rows
+
+"""
+Local columnar copy of the features table, joined with the response, so a modelling run does not have to pull every
+row ever collected from the database. The store is synced incrementally using an entry_id high-water mark and kept
+as raw binary files. matrix() memory maps them without copying any data; frame() and response() build dataframes
+with the schema's column types from the mapped matrix, which copies the columns it converts.
+
+Only the most recent gameweek of features can change after it is written (the collector replaces it if it is
+re-collected, and its response arrives a week later), so each sync truncates the store back to the start of that
+gameweek and fetches everything after it again.
+
+Values are stored as float32, which holds every column of the feature schema exactly, and frame() casts them back to
+the compact types declared in feature_schema.py.
+
+The store also keeps the columns of the history table the rolling features are built from, ordered by kickoff time,
+so a run does not read every match ever played either. The collector rewrites the current season's matches on every
+update, but only the points of the last few days' matches can still be corrected, so each sync truncates the stored
+history back to HISTORY_RESYNC_DAYS before its latest match and fetches everything after that again. Backfilling a
+past season adds earlier matches, which is caught by counting the matches before that point and refetching the
+whole history if the count has changed.
+
+The store only saves work if it outlives the process, so FEATURE_STORE_DIR should be a persistent volume, such as an
+EFS mount on Lambda. Left at the /tmp default, each new Lambda container starts with an empty store and syncs every
+row again.
+"""
+
+STORE_DIR = os.environ.get('FEATURE_STORE_DIR', '/tmp/feature_store')
+# bumped whenever the file layout changes, so stores written in an older layout are rebuilt
+STORE_VERSION = 3
+# days before the latest stored match from which the history is fetched again on every sync
+HISTORY_RESYNC_DAYS = int(os.environ.get('HISTORY_RESYNC_DAYS', 7))
+
+
+def empty_meta():
+    return {'version': STORE_VERSION, 'columns': [], 'integer_columns': [], 'rows': 0, 'stable_rows': 0,
+            'high_water_mark': 0, 'history_rows': 0, 'history_stable_rows': 0, 'history_since': None}
+
+
+class FeatureStore:
+    """ Memory mapped store of the features table, with the response held alongside it in a points_scored column
+    which is blank until the response is known.
+    Layout of store_dir:
+        values.f4: every numeric column as one row-major float32 matrix
+        entry_id.i8: entry ids, always in ascending order
+        timestamp.M8: collection timestamps
+        history_values.f4, history_player_id.i8, history_kickoff_time.M8: the history columns, player ids and
+            kickoff times of every match, ordered by kickoff time
+        meta.json: column names, row counts and the sync high-water marks
+    Args:
+        store_dir: directory holding the store
+    """
+
+    def __init__(self, store_dir: str = STORE_DIR):
+        self.store_dir = store_dir
+        self.values_path = os.path.join(store_dir, 'values.f4')
+        self.entry_id_path = os.path.join(store_dir, 'entry_id.i8')
+        self.timestamp_path = os.path.join(store_dir, 'timestamp.M8')
+        self.history_values_path = os.path.join(store_dir, 'history_values.f4')
+        self.history_player_id_path = os.path.join(store_dir, 'history_player_id.i8')
+        self.history_kickoff_time_path = os.path.join(store_dir, 'history_kickoff_time.M8')
+        self.meta_path = os.path.join(store_dir, 'meta.json')
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return empty_meta()
+        if meta.get('version') != STORE_VERSION:
+            print('Feature store was written in an older layout, rebuilding feature store...')
+            return empty_meta()
+        return meta
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _paths(self):
+        return [(self.values_path, 4 * len(self.meta['columns'])), (self.entry_id_path, 8), (self.timestamp_path, 8)]
+
+    def _history_paths(self):
+        return [(self.history_values_path, 4 * len(HISTORY_COLUMNS)), (self.history_player_id_path, 8),
+                (self.history_kickoff_time_path, 8)]
+
+    @staticmethod
+    def _truncate_files(paths, rows):
+        """ Cut every file back to the given number of rows, which also discards any partly written rows """
+        for path, row_bytes in paths:
+            with open(path, 'a+b') as f:
+                f.truncate(rows * row_bytes)
+
+    @staticmethod
+    def _append_files(paths_and_arrays):
+        for path, array in paths_and_arrays:
+            with open(path, 'ab') as f:
+                array.tofile(f)
+
+    def _truncate(self, rows):
+        self._truncate_files(self._paths(), rows)
+        self.meta['rows'] = rows
+
+    def _append(self, entry_ids, timestamps, values):
+        self._append_files([(self.values_path, values), (self.entry_id_path, entry_ids),
+                            (self.timestamp_path, timestamps)])
+        self.meta['rows'] += len(entry_ids)
+
+    def reset(self):
+        """ Empty the store, the next sync will fetch every row again """
+        self.meta = empty_meta()
+        os.makedirs(self.store_dir, exist_ok=True)
+        for path, _ in self._paths() + self._history_paths():
+            if os.path.exists(path):
+                os.remove(path)
+        self._write_meta()
+
+    def sync(self, engine):
+        """ Fetch the rows added to the database since the last sync """
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        if not engine.has_table('features'):
+            print('No features table yet, nothing to sync.')
+            return self
+        self._sync_history(engine)
+        # the collector only writes the response table once a second gameweek has been collected
+        if engine.has_table('response'):
+            query = 'SELECT f.*, r.points_scored FROM features f LEFT JOIN response r ON r.entry_id = f.entry_id '
+        else:
+            query = 'SELECT f.*, NULL AS points_scored FROM features f '
+        query = db.text(query + 'WHERE f.entry_id > :high_water_mark ORDER BY f.entry_id')
+        new = pd.read_sql(query, engine, params={'high_water_mark': self.meta['high_water_mark']},
+                          index_col='entry_id', parse_dates=['timestamp'])
+        record_rows('features', len(new), written=False)
+
+        timestamps = new.pop('timestamp')
+        # bootstrap values are stored as text by the collector, so convert every column to a number
+        values = new.apply(pd.to_numeric, errors='coerce')
+        columns = list(values.columns)
+
+        # start again from scratch if the table's columns have changed
+        if self.meta['columns'] and columns != self.meta['columns']:
+            print('Feature table columns changed, rebuilding feature store...')
+            self.reset()
+            return self.sync(engine)
+
+        if not self.meta['columns']:
+            self.meta['columns'] = columns
+            self.meta['integer_columns'] = [column for column in columns if new[column].dtype.kind in 'iub']
+
+        # drop the mutable latest gameweek and append everything fetched after the high-water mark
+        self._truncate(self.meta['stable_rows'])
+        self._append(np.ascontiguousarray(values.index.values, dtype=np.int64),
+                     np.ascontiguousarray(timestamps.values, dtype='datetime64[ns]'),
+                     np.ascontiguousarray(values.values, dtype=np.float32))
+
+        # the next sync restarts from the first row of the latest gameweek
+        stored_timestamps = self.timestamps()
+        if len(stored_timestamps):
+            stable_rows = int(np.argmax(stored_timestamps == stored_timestamps.max()))
+        else:
+            stable_rows = 0
+        self.meta['stable_rows'] = stable_rows
+        self.meta['high_water_mark'] = int(self.entry_ids()[stable_rows - 1]) if stable_rows else 0
+        self._write_meta()
+
+        print('Feature store synced: fetched {} rows, {} rows stored.'.format(len(new), self.meta['rows']))
+        return self
+
+    def _sync_history(self, engine):
+        """ Fetch the matches played since HISTORY_RESYNC_DAYS before the latest match stored by the last sync """
+
+        if not engine.has_table('history'):
+            return
+        since = self.meta['history_since']
+        since_param = db.bindparam('since', type_=db.DateTime)
+
+        # matches before since are never rewritten, so a different count means a backfill has added earlier ones
+        if since is not None:
+            query = db.text('SELECT COUNT(*) FROM history WHERE kickoff_time < :since').bindparams(since_param)
+            earlier = list(engine.execute(query, since=pd.Timestamp(since).to_pydatetime()))[0][0]
+            if earlier != self.meta['history_stable_rows']:
+                print('Earlier matches added to the history table, fetching the whole history again...')
+                since = None
+                self.meta['history_stable_rows'] = 0
+
+        query = 'SELECT player_id, kickoff_time, {} FROM history'.format(', '.join(HISTORY_COLUMNS))
+        if since is not None:
+            query += ' WHERE kickoff_time >= :since'
+        query = db.text(query + ' ORDER BY kickoff_time, player_id')
+        if since is not None:
+            query = query.bindparams(since_param)
+        new = pd.read_sql(query, engine, parse_dates=['kickoff_time'],
+                          params={'since': pd.Timestamp(since).to_pydatetime()} if since is not None else None)
+        record_rows('history', len(new), written=False)
+
+        self._truncate_files(self._history_paths(), self.meta['history_stable_rows'])
+        self._append_files([
+            (self.history_values_path, np.ascontiguousarray(new[HISTORY_COLUMNS].apply(
+                pd.to_numeric, errors='coerce').values, dtype=np.float32)),
+            (self.history_player_id_path, np.ascontiguousarray(new['player_id'].values, dtype=np.int64)),
+            (self.history_kickoff_time_path, np.ascontiguousarray(new['kickoff_time'].values, dtype='datetime64[ns]'))
+        ])
+        self.meta['history_rows'] = self.meta['history_stable_rows'] + len(new)
+
+        # the next sync fetches the matches from HISTORY_RESYNC_DAYS before the latest one again
+        kickoff_times = self._map(self.history_kickoff_time_path, 'datetime64[ns]', (self.meta['history_rows'],))
+        if len(kickoff_times):
+            since = kickoff_times[-1] - np.timedelta64(HISTORY_RESYNC_DAYS, 'D')
+            self.meta['history_stable_rows'] = int(np.searchsorted(kickoff_times, since, side='left'))
+            self.meta['history_since'] = str(pd.Timestamp(since))
+        else:
+            self.meta['history_stable_rows'] = 0
+            self.meta['history_since'] = None
+
+    def _map(self, path, dtype, shape):
+        # numpy cannot map an empty file
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+        # map copy-on-write, so callers can modify the arrays in memory without touching the files
+        return np.memmap(path, dtype=dtype, mode='c', shape=shape)
+
+    def matrix(self):
+        """ The numeric columns as a memory mapped (rows, columns) float32 matrix, no data is copied """
+        return self._map(self.values_path, np.float32, (self.meta['rows'], len(self.meta['columns'])))
+
+    def entry_ids(self):
+        return self._map(self.entry_id_path, np.int64, (self.meta['rows'],))
+
+    def timestamps(self):
+        return self._map(self.timestamp_path, 'datetime64[ns]', (self.meta['rows'],))
+
+    def _index(self):
+        return pd.Index(self.entry_ids(), name='entry_id')
+
+    def frame(self):
+        """ The features table as a dataframe indexed by entry_id, with the column types of the feature schema.
+        Building it copies the mapped values into the frame's columns, use matrix() to read them without a copy. """
+
+        # points_scored is always the last column of the matrix, so the features are a view of the rest
+        columns = self.meta['columns'][:-1]
+        frame = pd.DataFrame(self.matrix()[:, :-1], columns=columns, index=self._index())
+        frame['timestamp'] = self.timestamps()
+
+        frame = apply_schema(frame)
+
+        # restore any other integer columns where there are no blanks
+        for column in self.meta['integer_columns']:
+            if column in columns and column not in FEATURE_SCHEMA and not frame[column].isna().any():
+                frame[column] = frame[column].astype(np.int64)
+
+        return frame
+
+    def history(self):
+        """ The stored history as a dataframe of player_id, kickoff_time and the history columns the rolling features
+        are built from, ordered by kickoff time, or None if the collector has not written any history yet """
+        rows = self.meta['history_rows']
+        if not rows:
+            return None
+        history = pd.DataFrame(self._map(self.history_values_path, np.float32, (rows, len(HISTORY_COLUMNS))),
+                               columns=HISTORY_COLUMNS)
+        history.insert(0, 'player_id', self._map(self.history_player_id_path, np.int64, (rows,)))
+        history.insert(1, 'kickoff_time', self._map(self.history_kickoff_time_path, 'datetime64[ns]', (rows,)))
+        return history
+
+    def response(self):
+        """ The response table as a series of points_scored indexed by entry_id, for the rows where it is known """
+        response = pd.Series(self.matrix()[:, -1], index=self._index(), name='points_scored')
+        return apply_series_schema(response.dropna())
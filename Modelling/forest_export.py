@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+
+"""
+Exports a fitted StandardScaler + CustomRegressor pipeline to the flat array format read by forest_inference.py.
+The nodes of every tree are concatenated into single feature, threshold, child and value arrays, with each tree's
+child indices offset to point into the shared arrays and each leaf pointing back at itself.
+"""
+
+
+def export_pipeline(pipe, path):
+    """ Write the scaler, the logistic gate and the random forest of a fitted pipeline to one .npz file """
+
+    scaler = pipe.named_steps['scaler']
+    regressor = pipe.named_steps['regressor']
+    clf, forest = regressor.clf_, regressor.reg_
+
+    if not isinstance(clf, LogisticRegression) or not isinstance(forest, RandomForestRegressor):
+        raise ValueError('Only pipelines with a logistic classifier and a random forest regressor can be exported')
+
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+
+    features, thresholds, lefts, rights, values = [], [], [], [], []
+    for tree, offset in zip(trees, offsets):
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(offset + np.where(is_leaf, nodes, tree.children_left))
+        rights.append(offset + np.where(is_leaf, nodes, tree.children_right))
+        values.append(tree.value[:, 0, 0])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(
+        path,
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+        clf_coef=clf.coef_.ravel(),
+        clf_intercept=clf.intercept_,
+        clf_classes=clf.classes_.astype(np.float64),
+        roots=offsets.astype(np.intp),
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        value=np.concatenate(values),
+        max_depth=max(tree.max_depth for tree in trees)
+    )
+
+
+def _time_subprocess(code, cwd):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True)
+    return time.perf_counter() - start
+
+
+def benchmark(n_train=20000, n_players=650, n_features=8, repeats=20):
+    """ Check the exported model against the pipeline and compare import time, cold start time and per batch
+    latency of the NumPy path against the scikit-learn path """
+
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    from custom_regressor import CustomRegressor
+    from forest_inference import ForestModel
+
+    rng = np.random.default_rng(0)
+    X = rng.random((n_train, n_features)) * 10
+    y = np.where(X[:, 2] > 3, X[:, 0] + rng.normal(size=n_train), 0)
+    X_new = rng.random((n_players, n_features)) * 10
+
+    pipe = Pipeline([('scaler', StandardScaler()),
+                     ('regressor', CustomRegressor(reg_params={'max_depth': 6, 'min_samples_leaf': 2}))]).fit(X, y)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'forest.npz')
+        export_pipeline(pipe, path)
+        model = ForestModel(path)
+
+        # the modelling functions pass float32 frames, so check both precisions
+        for dtype in (np.float64, np.float32):
+            exported, fitted = model.predict(X_new.astype(dtype)), pipe.predict(X_new.astype(dtype))
+            print('Largest difference from pipeline predictions on {} input: {:.3g}'.format(
+                np.dtype(dtype).name, np.abs(exported - fitted).max()))
+            if not np.allclose(exported, fitted):
+                raise AssertionError('Exported model does not match the pipeline on {} input'.format(
+                    np.dtype(dtype).name))
+
+        import_numpy = _time_subprocess('import forest_inference', here)
+        import_sklearn = _time_subprocess('import data_modelling', here)
+        print('Import time: numpy {:.3f}s, scikit-learn {:.3f}s'.format(import_numpy, import_sklearn))
+
+        cold_numpy = _time_subprocess(
+            'import numpy as np, forest_inference; forest_inference.ForestModel({!r}).predict(np.random.random((1, {})))'
+            .format(path, n_features), here)
+        pipe_path = os.path.join(tmp, 'pipeline.joblib')
+        import joblib
+        joblib.dump(pipe, pipe_path)
+        cold_sklearn = _time_subprocess(
+            'import numpy as np, joblib, data_modelling; joblib.load({!r}).predict(np.random.random((1, {})))'
+            .format(pipe_path, n_features), here)
+        print('Cold start: numpy {:.3f}s, scikit-learn {:.3f}s'.format(cold_numpy, cold_sklearn))
+
+        for name, predict in [('numpy', model.predict), ('scikit-learn', pipe.predict)]:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                predict(X_new)
+            print('{} players per batch, {}: {:.2f}ms'.format(
+                n_players, name, 1000 * (time.perf_counter() - start) / repeats))
+
+
+if __name__ == "__main__":
+    benchmark()
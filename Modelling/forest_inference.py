@@ -0,0 +1,86 @@
+import os
+import io
+import base64
+import numpy as np
+
+"""
+Scores players with a CustomRegressor pipeline exported by forest_export.py, using nothing but NumPy. Every tree of
+the forest is flattened into shared node arrays, so all players are pushed down all trees together in one batched
+traversal. Importing this module does not import pandas or scikit-learn, which keeps Lambda cold starts short.
+"""
+
+MODEL_PATH = os.environ.get('FOREST_MODEL_PATH', '/tmp/model_artifacts/forest.npz')
+
+
+class ForestModel:
+    """ A StandardScaler + CustomRegressor pipeline loaded from the flat array format written by export_pipeline.
+    Args:
+        path: path of the .npz file
+    """
+
+    def __init__(self, path: str = MODEL_PATH):
+        with np.load(path) as arrays:
+            self.scaler_mean = arrays['scaler_mean']
+            self.scaler_scale = arrays['scaler_scale']
+            self.clf_coef = arrays['clf_coef']
+            self.clf_intercept = arrays['clf_intercept']
+            self.clf_classes = arrays['clf_classes']
+            self.roots = arrays['roots']
+            self.feature = arrays['feature']
+            self.threshold = arrays['threshold']
+            self.left = arrays['left']
+            self.right = arrays['right']
+            self.value = arrays['value']
+            self.max_depth = int(arrays['max_depth'])
+
+    def predict(self, X):
+        """ Predict for every row of X, matching the exported pipeline's predict """
+        # scale in place in the input's precision, exactly as the pipeline's StandardScaler does, so float32 rows fall
+        # on the same side of every threshold
+        X = np.asarray(X)
+        X = X.astype(np.float32 if X.dtype == np.float32 else np.float64)
+        X -= self.scaler_mean
+        X /= self.scaler_scale
+
+        # the classifier gates the prediction on the chance of playing, in column 2
+        decision = X[:, 2] * self.clf_coef[0] + self.clf_intercept[0]
+        gate = self.clf_classes[(decision > 0).astype(np.intp)]
+
+        # the trees compare float32 features against their thresholds, exactly as scikit-learn does
+        X = X.astype(np.float32)
+        rows = np.arange(len(X))[:, None]
+
+        # walk every (row, tree) pair down one level at a time, leaves point back at themselves
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return gate * self.value[nodes].mean(axis=1)
+
+
+def decode_matrix(encoded):
+    """ Read a frame sent by invoke_data_modelling as a 2D array, without pandas """
+    if encoded.get('format') != 'npz':
+        return np.array(encoded['data'])
+    if 'ref' in encoded:
+        raise ValueError('Frames passed by reference are not supported by the NumPy prediction handler')
+    with np.load(io.BytesIO(base64.b64decode(encoded['data'])), allow_pickle=False) as arrays:
+        return np.column_stack([arrays['column_{}'.format(i)] for i in range(len(encoded['columns']))])
+
+
+_model = None
+
+
+def handler(event, context):
+    # Load the exported model once per container
+    global _model
+    if _model is None:
+        _model = ForestModel()
+
+    predictions = _model.predict(decode_matrix(event["X_new"]))
+
+    return {
+        'statusCode': 200,
+        'predictions': predictions.tolist()
+    }
@@ -0,0 +1,55 @@
+import os
+import pandas as pd
+import sqlalchemy as db
+
+"""
+Predictions for each of the next few gameweeks rather than just the next one. The latest features row of every player
+is repeated once per upcoming fixture in the fixtures table written by the collector, with is_home and
+next_fixture_difficulty taken from that fixture, so the whole horizon is scored in a single predict call. Players
+with two fixtures in a gameweek have their predictions summed, and players with none are predicted zero.
+"""
+
+# number of upcoming gameweeks to predict, 0 predicts only the next gameweek
+HORIZON = int(os.environ.get('HORIZON', 0))
+
+
+def load_fixtures(engine, gameweek):
+    """ Read the fixtures from the given gameweek, the one the latest features rows were collected for, onwards.
+    Fixtures of earlier gameweeks, such as those kept for a player whose summary could not be fetched, have already
+    been played. Returns None if the collector has not written the table yet or there are no fixtures left, as after
+    the final gameweek, so the caller falls back to predicting the next gameweek only """
+    if not engine.has_table('fixtures'):
+        return None
+    fixtures = pd.read_sql(db.text('SELECT player_id, event, is_home, difficulty FROM fixtures '
+                                   'WHERE event >= :gameweek'), engine, params={'gameweek': int(gameweek)})
+    return fixtures if len(fixtures) else None
+
+
+def horizon_matrix(latest, fixtures, horizon=HORIZON):
+    """
+    Stack one copy of each player's latest features row per upcoming fixture in the next horizon gameweeks.
+    Args:
+        latest: the latest gameweek's rows of the features dataframe, including player_id
+        fixtures: the fixtures table as a dataframe
+        horizon: number of upcoming gameweeks to cover
+    Returns the stacked rows with the same columns as latest, the player_id and gameweek of each row, and the
+    gameweeks covered.
+    """
+
+    gameweeks = sorted(fixtures['event'].unique())[:horizon]
+    upcoming = fixtures.loc[fixtures['event'].isin(gameweeks), ['player_id', 'event', 'is_home', 'difficulty']]
+    upcoming = upcoming.rename(columns={'event': 'gameweek', 'difficulty': 'next_fixture_difficulty'})
+
+    # each copy takes the gameweek of its fixture in place of the one the row was collected for
+    stacked = latest.drop(columns=['is_home', 'next_fixture_difficulty', 'gameweek'], errors='ignore').merge(
+        upcoming, on='player_id')
+    return stacked[latest.columns], stacked[['player_id', 'gameweek']], gameweeks
+
+
+def horizon_predictions(keys, predictions, player_ids, gameweeks):
+    """ Combine the predictions for the stacked rows into one prediction per player per gameweek, summing double
+    gameweeks and filling blank gameweeks with zero """
+
+    predictions = keys.assign(prediction=predictions).groupby(['player_id', 'gameweek'])['prediction'].sum()
+    index = pd.MultiIndex.from_product([player_ids, gameweeks], names=['player_id', 'gameweek'])
+    return predictions.reindex(index, fill_value=0).to_frame()
@@ -1,90 +1,150 @@
 import os
-import json
-import boto3
 import pandas as pd
 import numpy as np
 import sqlalchemy as db
+from db_writer import write_frame
+from feature_store import FeatureStore
+from rolling_features import add_rolling_features
+from horizon import HORIZON, load_fixtures, horizon_matrix, horizon_predictions
+from feature_schema import KEY_COLUMNS, apply_schema
+from queries import prediction_rows
+from schema import check_schema
+from executors import shared_executor
+from metrics import instrument, checkpoint
 
-client = boto3.client('lambda')
 db_uri = os.environ.get('POSTGRES')
 
-def handler(event, context):
+# used when the hyperparameters table has not been written yet, as on a fresh local database
+DEFAULT_HYPERPARAMETERS = {'max_depth': 5, 'min_samples_leaf': 4, 'min_samples_split': 4}
 
-    # Connect to the database
-    engine = db.create_engine(db_uri)
 
-    # Retrieve the features, response, and player_info tables from the database
-    features = pd.read_sql('SELECT * FROM features', engine, index_col='entry_id')
-    response = pd.read_sql('SELECT * FROM response', engine, index_col='entry_id')
-    player_info = pd.read_sql('SELECT * FROM player_info', engine, index_col='id')
-    
-    # Retrieve hyperparameters from the database
+def load_hyperparameters(engine):
+    """ The hyperparameters written by the last grid search, or the defaults if there are none """
+    if not engine.has_table('hyperparameters'):
+        return dict(DEFAULT_HYPERPARAMETERS)
     hyperparameters = pd.read_sql('SELECT * FROM hyperparameters', con=engine)
-    hyperparameters_dict = {column: int(hyperparameters.loc[0, column]) for column in hyperparameters.columns}
-
-    # Fill any blanks in the features table - for the column chance of playing fill with 100 and the rest with 0
-    statuses = player_info.loc[:, 'status']
-    features = features.join(statuses, on='player_id')
-    
-    # get index values of unavailable, doubtful and injured players for this gameweek
-    unavailable_index = features[(features.timestamp == max(features.timestamp)) & 
-    ((features.status=='u') | (features.status=='s'))].index
-    injured_index = features[(features.timestamp == max(features.timestamp)) & (features.status == 'i')].index
-    doubtful_index = features[(features.timestamp == max(features.timestamp)) & (features.status == 'd')].index
-    
-    # Fill the na values accordingly
-    features.loc[unavailable_index, 'chance_of_playing'] = 0
-    features.loc[injured_index, 'chance_of_playing'] = 0
-    features.loc[doubtful_index, 'chance_of_playing'] = features.loc[doubtful_index, 'chance_of_playing'].fillna(50)
-    features['chance_of_playing'].fillna(100, inplace=True)
-    features.fillna(0, inplace=True)
-
-    # Join the response to the features table and drop unnecessary columns timestamp and player_id
+    return {column: int(hyperparameters.loc[0, column]) for column in hyperparameters.columns}
+
+
+def prepare_modelling_data(engine, horizon=HORIZON, store=None):
+    """
+    The training rows X and y, the rows to predict X_new and the hyperparameters for the modelling step, along with
+    the player id of each prediction row. In horizon mode X_new holds a row per upcoming fixture and horizon is
+    returned as the (keys, gameweeks) needed to combine the predictions, otherwise it is returned as None.
+    """
+
+    # Check the collector has brought the features table up to date with the schema, migrating it is left to the
+    # collector, which has the gameweek deadlines
+    check_schema(engine)
+
+    # Sync the local feature store with the rows added since the last run, and keep only the rows whose response
+    # is known, as an inner join against the response
+    store = (store or FeatureStore()).sync(engine)
+    response = store.response()
+    features = store.frame().loc[response.index]
+    checkpoint('feature store sync')
+
+    # Retrieve the latest gameweek's rows to predict, with chance_of_playing imputed from each player's status, in
+    # a single indexed query
+    new_df = prediction_rows(engine)
+    checkpoint('prediction rows')
+
+    # Add features built from each player's recent match history, ahead of the response
+    history = store.history()
+    if history is not None:
+        features = add_rolling_features(features, history)
+        new_df = add_rolling_features(new_df, history)
+    checkpoint('rolling features')
+
+    # Retrieve hyperparameters from the database
+    hyperparameters = load_hyperparameters(engine)
+
+    # Fill any blanks in the training rows - for the column chance of playing fill with 100 and the rest with 0
+    features['chance_of_playing'] = features['chance_of_playing'].fillna(100)
+    features = apply_schema(features.fillna(0))
+
+    # Join the response to the features table and drop the columns identifying each row
     df = features.join(response, how='inner')
-    df.drop(columns=['timestamp', 'player_id', 'status'], inplace=True)
+    df.drop(columns=KEY_COLUMNS, errors='ignore', inplace=True)
 
     # Set up X and y matrices
-    X, y = df.iloc[:, :-1].to_json(orient="split"), df.iloc[:, -1].to_json(orient="split")
-    
-    # Now retrieve the data to predict
-    new_df = features[features.timestamp == max(features.timestamp)].copy()
+    X, y = df.iloc[:, :-1], df.iloc[:, -1]
 
     # Pull out the player ids for use later
     player_ids = list(new_df['player_id'].values)
 
-    # Drop columns not used in the model
-    new_df.drop(columns=['timestamp', 'player_id', 'status'], inplace=True)
-    
-    # Convert new_df to a json format
-    new_df = new_df.to_json(orient="split")
-    
-    # Package data to sent to DataModelling Lambda function
-    inputParams = {
-        'X': json.loads(X),
-        'y': json.loads(y),
-        'hyperparameters': hyperparameters_dict,
-        'X_new': json.loads(new_df),
-        'grid': False
-    }
-    
-    # Invoke DataModelling Lambda function
-    response = client.invoke(
-        FunctionName = 'arn:aws:lambda:eu-west-2:388851918592:function:FPLDataModelling',
-        InvocationType = 'RequestResponse',
-        Payload = json.dumps(inputParams)
-    )
-
-    # Retrieve predictions from the response
-    predictions = json.load(response['Payload'])['predictions']
-    
+    # In horizon mode, predict every upcoming fixture in the next few gameweeks at once
+    fixtures = load_fixtures(engine, new_df['gameweek'].max()) if horizon else None
+    if fixtures is not None:
+        new_df, keys, gameweeks = horizon_matrix(new_df, fixtures, horizon)
+        horizon = (keys, gameweeks)
+    else:
+        horizon = None
+
+    # Drop columns not used in the model, keeping the training columns' order
+    new_df = new_df[X.columns]
+    checkpoint('prepare data')
+
+    return X, y, new_df, hyperparameters, player_ids, horizon
+
+
+def write_predictions(engine, predictions, player_ids, horizon=None):
+    """ Write the predictions to the database, combining the horizon predictions per player and gameweek first if
+    there are any, and return the next gameweek's predictions indexed by player_id """
+
+    # Combine the horizon predictions per player and gameweek, the next gameweek's make up the usual predictions
+    if horizon is not None:
+        keys, gameweeks = horizon
+        horizon_df = horizon_predictions(keys, predictions, player_ids, gameweeks)
+        predictions = list(horizon_df.xs(gameweeks[0], level='gameweek')['prediction'])
+
     # Put predictions in a dataframe with player_ids
     prediction_df = pd.DataFrame({'player_id': player_ids, 'prediction': predictions}).sort_values(
         by='prediction', ascending=False).set_index('player_id')
-    
-    # Dump predictions to the database
-    prediction_df.to_sql('predictions', con=engine, if_exists='replace')
+
+    # Dump predictions to the database, replacing the table in one transaction
+    with engine.begin() as connection:
+        write_frame(prediction_df, 'predictions', connection, if_exists='replace')
+        if horizon is not None:
+            write_frame(horizon_df, 'horizon_predictions', connection, if_exists='replace')
+    checkpoint('write predictions')
+
+    return prediction_df
+
+
+def run_modelling(engine, executor=None, horizon=HORIZON, store=None):
+    """ Prepare the data, using the given FeatureStore or the default one, run the modelling step on the given
+    executor, by default the one named by MODELLING_EXECUTOR, and write the predictions, returning them or None if
+    there is nothing to train on yet """
+
+    if not engine.has_table('features'):
+        print('No features collected yet, skipping modelling.')
+        return None
+
+    X, y, X_new, hyperparameters, player_ids, horizon = prepare_modelling_data(engine, horizon, store)
+    if len(X) == 0:
+        print('No rows with a known response yet, skipping modelling.')
+        return None
+
+    predictions = (executor or shared_executor()).run(X, y, X_new, hyperparameters)
+    checkpoint('modelling')
+
+    return write_predictions(engine, predictions, player_ids, horizon)
+
+
+@instrument('invoke_data_modelling')
+def handler(event, context):
+
+    # Connect to the database
+    engine = db.create_engine(db_uri)
+
+    # Run the modelling step on the executor named in the event, or MODELLING_EXECUTOR, which defaults to the
+    # DataModelling Lambda function
+    event = event or {}
+    executor = shared_executor(event['executor']) if 'executor' in event else None
+    run_modelling(engine, executor, event.get('horizon', HORIZON))
 
     return {
         'status': 200,
         'body': 'Data modelled successfully and predictions added to database' 
-    }
\ No newline at end of file
+    }
@@ -2,28 +2,47 @@ import sqlalchemy as db
 import pandas as pd
 import numpy as np
 import os
-from CustomRegressor import CustomRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.metrics import mean_squared_error
-from sklearn.pipeline import Pipeline
-
-def modelling(db_uri=os.environ.get('DB_URI')):
+from sklearn.model_selection import train_test_split
+from db_writer import write_frame
+from feature_store import FeatureStore
+from rolling_features import add_rolling_features
+from search import CachedSearch
+from feature_schema import KEY_COLUMNS, apply_schema
+from queries import prediction_rows
+from schema import check_schema
+
+def modelling(db_uri=os.environ.get('DB_URI'), halving=True):
     # Connect to the database
     engine = db.create_engine(db_uri)
 
-    # Retrieve the features, response, and player_info tables from the database
-    features = pd.read_sql('SELECT * FROM features', engine, index_col='entry_id')
-    response = pd.read_sql('SELECT * FROM response', engine, index_col='entry_id')
+    # Check the collector has brought the features table up to date with the schema, migrating it is left to the
+    # collector, which has the gameweek deadlines
+    check_schema(engine)
+
+    # Sync the local feature store with the rows added since the last run, and keep only the rows whose response
+    # is known, as an inner join against the response
+    store = FeatureStore().sync(engine)
+    response = store.response()
+    features = store.frame().loc[response.index]
+
+    # Retrieve the latest gameweek's rows to predict, with chance_of_playing imputed from each player's status
+    new_df = prediction_rows(engine)
+
+    # Add features built from each player's recent match history, ahead of the response
+    history = store.history()
+    if history is not None:
+        features = add_rolling_features(features, history)
+        new_df = add_rolling_features(new_df, history)
+
     player_info = pd.read_sql('SELECT * FROM player_info', engine, index_col='id')
 
     # Fill any blanks in the features table - for the column chance of playing fill with 100 and the rest with 0
-    features['chance_of_playing'].fillna(100, inplace=True)
-    features.fillna(0, inplace=True)
+    features['chance_of_playing'] = features['chance_of_playing'].fillna(100)
+    features = apply_schema(features.fillna(0))
 
-    # Join the response to the features table and drop unnecessary columns timestamp and player_id
+    # Join the response to the features table and drop the columns identifying each row
     df = features.join(response, how='inner')
-    df.drop(columns=['timestamp', 'player_id'], inplace=True)
+    df.drop(columns=KEY_COLUMNS, errors='ignore', inplace=True)
 
     # Set up X and y matrices
     X, y = df.iloc[:, :-1], df.iloc[:, -1]
@@ -31,12 +50,6 @@ def modelling(db_uri=os.environ.get('DB_URI')):
     # Split into train and test sets of features and response
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, random_state=0)
 
-    # DATA PIPELINE:
-    pipe = Pipeline([
-        ('scaler', StandardScaler()),
-        ('regressor', CustomRegressor())
-    ])
-
     # Set parameters to gridsearch over
     max_depth = np.arange(3, 7)
     min_samples_leaf = np.arange(2, 11)
@@ -45,12 +58,9 @@ def modelling(db_uri=os.environ.get('DB_URI')):
     reg_params = [{'max_depth': md, 'min_samples_leaf': msl, 'min_samples_split': mss}
     for md in max_depth for msl in min_samples_leaf for mss in min_samples_split]
 
-    param_grid = [{
-            'regressor__reg_params': reg_params,
-        }]
-
-    # Fit the gridsearched model to the training data with 4-fold CV
-    grid = GridSearchCV(pipe, n_jobs=-1, param_grid=param_grid, cv=4, verbose=True, scoring='r2')
+    # Search the scaler + CustomRegressor pipeline over reg_params on the training data with 4-fold CV. The scaler and
+    # classifier are shared between candidates, and with halving weak candidates are dropped on small subsamples
+    grid = CachedSearch(reg_params, cv=4, halving=halving, n_jobs=-1)
     grid.fit(X_train, y_train)
 
     # Give best CV score, as well as training and test set performance with the gridsearched parameters
@@ -63,17 +73,15 @@ def modelling(db_uri=os.environ.get('DB_URI')):
     params = grid.best_params_
     param_df = pd.DataFrame(columns=['max_depth', 'min_samples_leaf', 'min_samples_split'])
     param_df.loc[0] = params['regressor__reg_params'].values()
-    param_df.to_sql('hyperparameters', con=engine, if_exists='replace')
+    with engine.begin() as connection:
+        write_frame(param_df, 'hyperparameters', connection, if_exists='replace')
 
        
-    # Now retrieve the data to predict
-    new_df = features[features.timestamp == max(features.timestamp)].copy()
-
-    # Pull out the player ids for use later
+    # Pull out the player ids of the rows to predict for use later
     player_ids = new_df['player_id'].values
 
-    # Drop columns not used in the model
-    new_df.drop(columns=['timestamp', 'player_id'], inplace=True)
+    # Drop columns not used in the model, keeping the training columns' order
+    new_df = new_df[X.columns]
 
     # Make new predictions and add to a DF with the player_ids
     new_predictions = grid.predict(new_df)
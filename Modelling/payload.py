@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import time
+import uuid
+import base64
+import numpy as np
+import pandas as pd
+
+"""
+Wire format for the frames passed from invoke_data_modelling to data_modelling. Each frame is sent as a compressed
+.npz holding one array per column, so the values stay binary and keep their dtypes and column names. Payloads larger
+than PAYLOAD_INLINE_LIMIT bytes once base64 encoded are written to PAYLOAD_STORE, either an S3 location
+('s3://bucket/prefix') or a local directory standing in for one, and passed by reference instead. encode_payload
+also spills the largest frames of a whole invocation to the store until it fits within PAYLOAD_LIMIT bytes, keeping
+it under the 6 MB Lambda request limit. Each frame passed by reference is only read once, by the modelling function,
+which deletes it from the store once read so the store does not keep every week's training matrix. Frames in the old
+to_json(orient="split") format are still accepted.
+"""
+
+PAYLOAD_STORE = os.environ.get('PAYLOAD_STORE')
+PAYLOAD_INLINE_LIMIT = int(os.environ.get('PAYLOAD_INLINE_LIMIT', 4000000))
+# the Lambda request limit is 6 MB, leave room for the invocation's headers
+PAYLOAD_LIMIT = int(os.environ.get('PAYLOAD_LIMIT', 6000000))
+
+
+def _put_object(key, data, store):
+    if store.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = store[len('s3://'):].partition('/')
+        boto3.client('s3').put_object(Bucket=bucket, Key=prefix.rstrip('/') + '/' + key, Body=data)
+    else:
+        os.makedirs(store, exist_ok=True)
+        with open(os.path.join(store, key), 'wb') as f:
+            f.write(data)
+
+
+def _get_object(key, store):
+    if store.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = store[len('s3://'):].partition('/')
+        return boto3.client('s3').get_object(Bucket=bucket, Key=prefix.rstrip('/') + '/' + key)['Body'].read()
+    with open(os.path.join(store, key), 'rb') as f:
+        return f.read()
+
+
+def _delete_object(key, store):
+    if store.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = store[len('s3://'):].partition('/')
+        boto3.client('s3').delete_object(Bucket=bucket, Key=prefix.rstrip('/') + '/' + key)
+    else:
+        os.remove(os.path.join(store, key))
+
+
+def encode_frame(frame, store=PAYLOAD_STORE, inline_limit=PAYLOAD_INLINE_LIMIT):
+    """ Encode a numeric DataFrame or Series as a json serialisable dict holding a compressed .npz, stored by
+    reference if a store is configured and the base64 encoded data is larger than inline_limit bytes. """
+
+    is_series = isinstance(frame, pd.Series)
+    if is_series:
+        frame = frame.to_frame()
+
+    arrays = {'index': frame.index.values}
+    for i, column in enumerate(frame.columns):
+        arrays['column_{}'.format(i)] = frame[column].values
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    data = buffer.getvalue()
+
+    encoded = {
+        'format': 'npz',
+        'series': is_series,
+        'columns': [str(column) for column in frame.columns],
+        'index_name': frame.index.name
+    }
+    encoded['data'] = base64.b64encode(data).decode('ascii')
+    if store and len(encoded['data']) > inline_limit:
+        _spill(encoded, store)
+    return encoded
+
+
+def _spill(encoded, store):
+    """ Move the data of an inline encoded frame to the store, leaving a reference to it """
+    key = '{}.npz'.format(uuid.uuid4().hex)
+    _put_object(key, base64.b64decode(encoded.pop('data')), store)
+    encoded['ref'] = key
+
+
+def encode_payload(payload, frames, store=PAYLOAD_STORE, limit=PAYLOAD_LIMIT):
+    """
+    Encode an invocation payload as a json string, with the frames given as a dict of name to frame encoded by
+    encode_frame and merged into the rest of the payload. While the whole payload is larger than limit bytes the
+    largest inline frame is moved to the store. Raises ValueError if it cannot be made to fit.
+    """
+
+    payload = dict(payload, **{name: encode_frame(frame, store) for name, frame in frames.items()})
+    message = json.dumps(payload)
+    while len(message) > limit:
+        inline = [name for name in frames if 'data' in payload[name]]
+        if not store or not inline:
+            raise ValueError('Payload of {:,} bytes is over the {:,} byte limit, set PAYLOAD_STORE to pass its frames '
+                             'by reference'.format(len(message), limit))
+        _spill(payload[max(inline, key=lambda name: len(payload[name]['data']))], store)
+        message = json.dumps(payload)
+    return message
+
+
+def decode_frame(encoded, store=PAYLOAD_STORE, delete=False):
+    """ Decode a frame encoded by encode_frame, or sent in the old to_json(orient="split") format. With delete, a
+    frame passed by reference is removed from the store once it has been read. """
+
+    # old format: plain lists of index, columns and data
+    if 'format' not in encoded:
+        if 'columns' in encoded:
+            return pd.DataFrame(encoded['data'], index=encoded['index'], columns=encoded['columns'])
+        return pd.Series(encoded['data'], index=encoded['index'], name=encoded.get('name'))
+
+    if 'ref' in encoded:
+        data = _get_object(encoded['ref'], store)
+        if delete:
+            _delete_object(encoded['ref'], store)
+    else:
+        data = base64.b64decode(encoded['data'])
+
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        index = pd.Index(arrays['index'], name=encoded['index_name'])
+        frame = pd.DataFrame({column: arrays['column_{}'.format(i)] for i, column in enumerate(encoded['columns'])},
+                             index=index)
+
+    if encoded['series']:
+        return frame.iloc[:, 0]
+    return frame
+
+
+def benchmark(rows=(20000, 100000, 500000), columns=8, repeats=3):
+    """ Compare payload size and encode/decode time of the npz format against the old json path on random
+    frames shaped like the features table """
+
+    rng = np.random.default_rng(0)
+    for n_rows in rows:
+        frame = pd.DataFrame(rng.random((n_rows, columns)) * 10, columns=['column_{}'.format(i) for i in range(columns)])
+        frame.index.name = 'entry_id'
+
+        def old_encode():
+            return json.dumps(json.loads(frame.to_json(orient="split")))
+
+        def old_decode(message):
+            return np.array(json.loads(message)['data'])
+
+        def new_encode():
+            return json.dumps(encode_frame(frame, store=None))
+
+        def new_decode(message):
+            return decode_frame(json.loads(message), store=None).values
+
+        for name, encode, decode in [('json', old_encode, old_decode), ('npz', new_encode, new_decode)]:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                message = encode()
+            encode_time = (time.perf_counter() - start) / repeats
+            start = time.perf_counter()
+            for _ in range(repeats):
+                decode(message)
+            decode_time = (time.perf_counter() - start) / repeats
+            print('{:>7} rows {:>5}: {:>12,} bytes, encode {:.3f}s, decode {:.3f}s'.format(
+                n_rows, name, len(message), encode_time, decode_time))
+
+
+if __name__ == "__main__":
+    benchmark()
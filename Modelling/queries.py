@@ -0,0 +1,42 @@
+import pandas as pd
+import sqlalchemy as db
+from feature_schema import apply_schema
+from schema import LATEST_GAMEWEEK_QUERY
+from metrics import record_rows
+
+"""
+SQL for the modelling functions, so filtering is done by the database rather than in pandas over every row ever
+collected. The prediction rows are the latest gameweek's features with chance_of_playing imputed from each player's
+status, selected in one statement using the (season, gameweek) index created by schema.py, so preparing them costs
+O(players) however long the history grows. The training rows are the features inner joined with the response.
+"""
+
+# the latest gameweek's rows, with chance_of_playing set to 0 for unavailable, suspended and injured players, 50 for
+# doubtful players with no chance given, and 100 for everyone else with no chance given
+PREDICTION_QUERY = '''
+SELECT f.*,
+       CASE WHEN p.status IN ('u', 's', 'i') THEN 0
+            WHEN p.status = 'd' THEN COALESCE(CAST(f.chance_of_playing AS REAL), 50)
+            ELSE COALESCE(CAST(f.chance_of_playing AS REAL), 100)
+       END AS imputed_chance_of_playing
+FROM features f
+INNER JOIN ({}) latest ON f.season = latest.season AND f.gameweek = latest.gameweek
+LEFT JOIN player_info p ON p.id = f.player_id
+'''.format(LATEST_GAMEWEEK_QUERY)
+
+TRAINING_QUERY = '''
+SELECT f.*, r.points_scored
+FROM features f
+INNER JOIN response r ON r.entry_id = f.entry_id
+ORDER BY f.entry_id
+'''
+
+
+def prediction_rows(engine):
+    """ The latest gameweek's features, indexed by entry_id, with chance_of_playing imputed and every other blank
+    filled with 0 """
+
+    latest = pd.read_sql(db.text(PREDICTION_QUERY), engine, index_col='entry_id', parse_dates=['timestamp'])
+    record_rows('features', len(latest), written=False)
+    latest['chance_of_playing'] = latest.pop('imputed_chance_of_playing')
+    return apply_schema(latest.fillna(0))
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from metrics import record_rows
+
+"""
+Features built from players' full match histories, as stored in the history table by the collector. Means over the
+last few matches and exponentially weighted means are computed for every player at once over the whole history in
+one long array, and each features row is given the values as of the last match that kicked off before it was
+collected. The modelling functions read the history from the FeatureStore, which keeps a copy of it in step with the
+history table.
+"""
+
+# per match columns of the history table to build features from
+HISTORY_COLUMNS = ['total_points', 'minutes', 'bps', 'influence', 'creativity', 'threat']
+# numbers of recent matches to average over
+WINDOWS = (3, 5, 10)
+# halflife, in matches, of the exponentially weighted means
+HALFLIFE = 3
+
+
+def rolling_features(history, columns=HISTORY_COLUMNS, windows=WINDOWS, halflife=HALFLIFE):
+    """ Return a dataframe with player_id, kickoff_time and, for each column, the mean over the last n matches up
+    to and including each match for every n in windows, plus an exponentially weighted mean """
+
+    history = history.sort_values(['player_id', 'kickoff_time'], ignore_index=True)
+    players = history['player_id'].values
+    values = history[columns].to_numpy(dtype=np.float64)
+    values[np.isnan(values)] = 0
+    n = len(values)
+    rows = np.arange(n)
+
+    # index of the first match of each row's player, so windows never reach into another player's history
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = players[1:] != players[:-1]
+    group_start = np.maximum.accumulate(np.where(is_start, rows, 0))
+
+    # with a running total, the sum over any window is a difference of two totals
+    totals = np.zeros((n + 1, len(columns)))
+    np.cumsum(values, axis=0, out=totals[1:])
+
+    features = {'player_id': history['player_id'], 'kickoff_time': history['kickoff_time']}
+    for window in windows:
+        window_start = np.maximum(group_start, rows - window + 1)
+        means = (totals[rows + 1] - totals[window_start]) / (rows + 1 - window_start)[:, None]
+        for i, column in enumerate(columns):
+            features['{}_last_{}'.format(column, window)] = means[:, i]
+
+    weighted = pd.DataFrame(values, columns=columns).groupby(players).ewm(halflife=halflife).mean()
+    weighted = weighted.reset_index(level=0, drop=True).sort_index()
+    for column in columns:
+        features['{}_ewm'.format(column)] = weighted[column].values
+
+    return pd.DataFrame(features)
+
+
+def load_history(engine):
+    """ Read the whole history table, or return None if the collector has not written one yet. Only used where
+    every row is read straight from the database anyway, the FeatureStore keeps an incrementally synced copy """
+    if not engine.has_table('history'):
+        return None
+    history = pd.read_sql('SELECT * FROM history', engine, parse_dates=['kickoff_time'])
+    record_rows('history', len(history), written=False)
+    return history
+
+
+def add_rolling_features(features, history, **kwargs):
+    """ Append the rolling features of each player's last match before each row's timestamp to the features
+    dataframe as float32 columns. Rows with no match before them get zeros. """
+    return join_rolling_features(features, rolling_features(history, **kwargs))
+
+
+def join_rolling_features(features, rolling):
+    """ add_rolling_features with the output of rolling_features already computed, so it can be joined to many
+    chunks of the features without recomputing it over the whole history for each """
+
+    rolling = rolling.assign(player_id=rolling['player_id'].astype(np.int64))
+    # already sorted when it is shared between chunks, so the sort is only paid once
+    if not rolling['kickoff_time'].is_monotonic_increasing:
+        rolling = rolling.sort_values('kickoff_time')
+
+    rows = features[['player_id', 'timestamp']].reset_index()
+    rows['player_id'] = rows['player_id'].astype(np.int64)
+
+    # match each row to the latest match that kicked off strictly before it was collected
+    merged = pd.merge_asof(rows.sort_values('timestamp'), rolling,
+                           left_on='timestamp', right_on='kickoff_time', by='player_id',
+                           direction='backward', allow_exact_matches=False)
+    merged = merged.set_index(features.index.name).drop(columns=['player_id', 'timestamp', 'kickoff_time'])
+
+    return features.join(merged.fillna(0).astype(np.float32))
+
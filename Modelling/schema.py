@@ -0,0 +1,289 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+
+"""
+Managed schema of the features table. Migrations are applied in order and recorded in a schema_migrations table,
+so each runs once per database: they add season (the year the season starts in) and gameweek columns, filled in
+for rows collected before the columns existed, and index the features table by (season, gameweek), player_id and
+entry_id so the latest gameweek can be found and replaced without scanning every row ever collected. On PostgreSQL
+the table can also be partitioned by season. The same file is kept in both the DataCollector and Modelling
+directories, as each is deployed on its own.
+"""
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS features_timestamp_idx ON features (timestamp)',
+    'CREATE INDEX IF NOT EXISTS features_season_gameweek_idx ON features (season, gameweek)',
+    'CREATE INDEX IF NOT EXISTS features_player_id_idx ON features (player_id)',
+    'CREATE INDEX IF NOT EXISTS ix_features_entry_id ON features (entry_id)'
+]
+
+LATEST_GAMEWEEK_QUERY = 'SELECT season, gameweek FROM features ORDER BY season DESC, gameweek DESC LIMIT 1'
+
+
+def season_of(timestamp):
+    """ Seasons are identified by the year they start in, a season starts in July """
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.year if timestamp.month >= 7 else timestamp.year - 1
+
+
+def _statements(*statements):
+    def run(connection, deadlines):
+        for statement in statements:
+            connection.execute(db.text(statement))
+    return run
+
+
+def _add_season_and_gameweek(connection, deadlines):
+    """ Add the season and gameweek columns and fill them in for existing rows. A row collected before a gameweek's
+    deadline belongs to that gameweek. Finished seasons before the one the deadlines cover have their collections
+    numbered in order instead, as their deadlines are no longer to hand. Without deadlines, or with rows from a later
+    season than they cover, the rows cannot be placed and a ValueError is raised, as numbering the current season's
+    collections in order would shift every gameweek after a missed collection. """
+
+    columns = {column['name'] for column in db.inspect(connection).get_columns('features')}
+    for column in ['season', 'gameweek']:
+        if column not in columns:
+            connection.execute('ALTER TABLE features ADD COLUMN {} SMALLINT'.format(column))
+
+    timestamps = pd.read_sql('SELECT DISTINCT timestamp FROM features WHERE season IS NULL OR gameweek IS NULL',
+                             connection, parse_dates=['timestamp'])['timestamp'].sort_values(ignore_index=True)
+    if not len(timestamps):
+        return
+
+    seasons = timestamps.map(season_of)
+    if deadlines is None or not len(deadlines):
+        raise ValueError('Gameweek deadlines are needed to place the {} collections of features rows without a '
+                         'gameweek, run the collector or pass them to migrate()'.format(len(timestamps)))
+    deadlines = deadlines.sort_values()
+    deadline_season = season_of(deadlines.iloc[0])
+    if (seasons > deadline_season).any():
+        raise ValueError('Features rows from season {} need that season\'s deadlines to be placed, not those of {}'
+                         .format(seasons.max(), deadline_season))
+
+    gameweeks = timestamps.groupby(seasons).rank(method='dense').astype(int)
+    in_season = seasons == deadline_season
+    positions = np.searchsorted(deadlines.values, timestamps[in_season].values)
+    gameweeks[in_season] = deadlines.index[np.minimum(positions, len(deadlines) - 1)]
+
+    # bound as a DateTime so it is written in the same format as the stored timestamps, which on SQLite are text
+    update = db.text('UPDATE features SET season = :season, gameweek = :gameweek WHERE timestamp = :timestamp'
+                     ).bindparams(db.bindparam('timestamp', type_=db.DateTime))
+    connection.execute(update,
+                       [{'season': int(season), 'gameweek': int(gameweek), 'timestamp': timestamp.to_pydatetime()}
+                        for season, gameweek, timestamp in zip(seasons, gameweeks, timestamps)])
+
+
+# (version, description, function of the connection and gameweek deadlines) in the order they are applied
+MIGRATIONS = [
+    (1, 'index features by timestamp', _statements(INDEXES[0])),
+    (2, 'add season and gameweek columns', _add_season_and_gameweek),
+    (3, 'index features by season and gameweek, player_id and entry_id', _statements(*INDEXES[1:]))
+]
+
+
+def migrate(connectable, deadlines=None):
+    """
+    Apply any migrations not yet recorded in schema_migrations. Nothing is done until the features table exists.
+    Args:
+        connectable: an engine, or a connection from engine.begin() to migrate within its transaction
+        deadlines: series of the current season's gameweek deadlines indexed by gameweek, used to place rows
+            collected before the gameweek column existed
+    """
+
+    if isinstance(connectable, db.engine.Engine):
+        with connectable.begin() as connection:
+            return migrate(connection, deadlines)
+
+    connection = connectable
+    if not connection.dialect.has_table(connection, 'features'):
+        return
+    connection.execute('CREATE TABLE IF NOT EXISTS schema_migrations '
+                       '(version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP)')
+    applied = {row[0] for row in connection.execute('SELECT version FROM schema_migrations')}
+
+    for version, description, apply in MIGRATIONS:
+        if version in applied:
+            continue
+        print('Applying migration {}: {}'.format(version, description))
+        apply(connection, deadlines)
+        connection.execute(db.text('INSERT INTO schema_migrations VALUES (:version, :description, :applied_at)'),
+                           version=version, description=description, applied_at=pd.Timestamp.now().to_pydatetime())
+
+
+def check_schema(connectable):
+    """ Raise a RuntimeError if the features table exists but has migrations still to apply. The modelling
+    functions only read the table, and leave migrating it to the collector, which has the deadlines needed. """
+
+    if isinstance(connectable, db.engine.Engine):
+        with connectable.connect() as connection:
+            return check_schema(connection)
+
+    connection = connectable
+    if not connection.dialect.has_table(connection, 'features'):
+        return
+    applied = set()
+    if connection.dialect.has_table(connection, 'schema_migrations'):
+        applied = {row[0] for row in connection.execute('SELECT version FROM schema_migrations')}
+    pending = [version for version, _, _ in MIGRATIONS if version not in applied]
+    if pending:
+        raise RuntimeError('The features table has migrations {} still to apply, run the collector or '
+                           '`python schema.py` first'.format(', '.join(map(str, pending))))
+
+
+def deadlines_of(bootstrap):
+    """ The gameweek deadlines of a bootstrap-static payload as a series indexed by gameweek, for migrate() """
+    events = pd.DataFrame.from_records(bootstrap['events']).set_index('id')
+    return pd.to_datetime(events['deadline_time']).dt.tz_localize(None)
+
+
+def _load_bootstrap(source):
+    """ Read a bootstrap-static payload from a file or a url """
+    import json
+    from urllib.request import Request, urlopen
+    if os.path.exists(source):
+        with open(source) as f:
+            return json.load(f)
+    with urlopen(Request(source, headers={'User-Agent': 'Mozilla/5.0'})) as response:
+        return json.load(response)
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    query = ("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+             "WHERE c.relname = 'features'")
+    return bool(list(connection.execute(query)))
+
+
+def ensure_partition(connection, season):
+    """ Create the partition for a season's rows if the features table is partitioned and has none yet """
+    if is_partitioned(connection):
+        connection.execute('CREATE TABLE IF NOT EXISTS features_{0} PARTITION OF features FOR VALUES IN ({0})'
+                           .format(int(season)))
+
+
+def partition_by_season(connection):
+    """ Rebuild the features table as a PostgreSQL table partitioned by season, with one partition per season, so
+    queries and deletes on one season never touch the others """
+
+    if connection.dialect.name != 'postgresql':
+        raise ValueError('Partitioning is only supported on PostgreSQL')
+    if is_partitioned(connection):
+        return
+
+    seasons = [row[0] for row in connection.execute('SELECT DISTINCT season FROM features')]
+    connection.execute('ALTER TABLE features RENAME TO features_unpartitioned')
+    connection.execute('CREATE TABLE features (LIKE features_unpartitioned INCLUDING DEFAULTS) '
+                       'PARTITION BY LIST (season)')
+    for season in seasons:
+        ensure_partition(connection, season)
+    connection.execute('INSERT INTO features SELECT * FROM features_unpartitioned')
+    # the indexes go with the old table, and are created again on every partition
+    connection.execute('DROP TABLE features_unpartitioned')
+    for statement in INDEXES:
+        connection.execute(statement)
+
+
+def _hot_queries(connection, season, gameweek):
+    """ Time the collector's hot queries, the delete is rolled back """
+
+    timings = {}
+    start = time.perf_counter()
+    list(connection.execute(LATEST_GAMEWEEK_QUERY))
+    timings['latest gameweek'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    list(connection.execute(db.text('SELECT entry_id, player_id FROM features WHERE season = :season AND '
+                                    'gameweek = :gameweek'), season=season, gameweek=gameweek))
+    timings['entry id mapping'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    list(connection.execute('SELECT MAX(entry_id) FROM features'))
+    timings['last entry id'] = time.perf_counter() - start
+
+    transaction = connection.begin()
+    start = time.perf_counter()
+    connection.execute(db.text('DELETE FROM features WHERE season = :season AND gameweek = :gameweek'),
+                       season=season, gameweek=gameweek)
+    timings['delete gameweek'] = time.perf_counter() - start
+    transaction.rollback()
+
+    return timings
+
+
+def benchmark(db_uri=None, seasons=(1, 3, 10), players=650, gameweeks=38, repeats=5):
+    """ Time the collector's hot queries against a features table holding each number of seasons of synthetic rows,
+    with the schema migrated. With the indexes in place the latencies stay flat as the table grows. The rows are
+    written to db_uri, which must be a scratch database, or to a temporary SQLite database by default. """
+
+    from db_writer import write_frame
+    from feature_schema import apply_schema
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = db.create_engine(db_uri or 'sqlite:///{}'.format(os.path.join(tmp, 'benchmark.db')))
+        rng = np.random.default_rng(0)
+        results = []
+        written = 0
+
+        for n_seasons in seasons:
+            # add seasons until the table holds n_seasons of them
+            for season in range(2000 + written, 2000 + n_seasons):
+                season_gameweeks = np.repeat(np.arange(1, gameweeks + 1), players)
+                n = len(season_gameweeks)
+                features = pd.DataFrame({
+                    'player_id': np.tile(np.arange(1, players + 1), gameweeks),
+                    'team_id': rng.integers(1, 21, n),
+                    'ict_index': rng.random(n) * 100,
+                    'chance_of_playing': rng.choice([0, 25, 50, 75, 100], n),
+                    'form': rng.random(n) * 10,
+                    'points_per_game': rng.random(n) * 10,
+                    'previous_points': rng.integers(0, 15, n),
+                    'is_home': rng.integers(0, 2, n),
+                    'next_fixture_difficulty': rng.integers(1, 6, n),
+                    'timestamp': pd.Timestamp(season, 8, 1) + pd.to_timedelta(season_gameweeks * 7, unit='D'),
+                    'season': season,
+                    'gameweek': season_gameweeks
+                }, index=pd.RangeIndex(written * n + 1, (written + 1) * n + 1, name='entry_id'))
+                with engine.begin() as connection:
+                    ensure_partition(connection, season)
+                    write_frame(apply_schema(features), 'features', connection)
+                written += 1
+            migrate(engine)
+
+            with engine.connect() as connection:
+                season, gameweek = list(connection.execute(LATEST_GAMEWEEK_QUERY))[0]
+                timings = pd.DataFrame([_hot_queries(connection, season, gameweek) for _ in range(repeats)])
+            result = dict(timings.median() * 1000, seasons=n_seasons, rows=written * players * gameweeks)
+            print('{} seasons ({} rows): {}'.format(n_seasons, result['rows'], ', '.join(
+                '{} {:.2f}ms'.format(name, result[name]) for name in timings.columns)))
+            results.append(result)
+
+        engine.dispose()
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate the features table, optionally partitioning it by season')
+    parser.add_argument('--db-uri', default=os.environ.get('POSTGRES'))
+    parser.add_argument('--partition', action='store_true', help='partition the features table by season')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time the hot queries on synthetic tables of growing size instead')
+    parser.add_argument('--scratch-db-uri', help='database to write the benchmark tables to, SQLite by default')
+    parser.add_argument('--bootstrap', default=os.environ.get('FPL_API_URL', 'https://fantasy.premierleague.com/api/')
+                        + 'bootstrap-static/', help='file or url of the bootstrap-static payload holding the current '
+                                                    'season\'s deadlines, used to place rows without a gameweek')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.scratch_db_uri)
+    else:
+        engine = db.create_engine(args.db_uri)
+        migrate(engine, deadlines_of(_load_bootstrap(args.bootstrap)))
+        if args.partition:
+            with engine.begin() as connection:
+                partition_by_season(connection)
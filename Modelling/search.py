@@ -0,0 +1,129 @@
+import math
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.model_selection import KFold
+from sklearn.metrics import r2_score
+from custom_regressor import CustomRegressor
+
+"""
+Hyperparameter search for the StandardScaler + CustomRegressor pipeline. Only the regression half of CustomRegressor
+depends on reg_params, so the scaler and the classifier are fitted once per fold and shared by every candidate
+instead of being refitted for each one. The search can also run as a successive halving search, which scores every
+candidate on a small subsample of each fold and only carries the best forward to larger subsamples.
+"""
+
+
+def _score_candidate(reg_name, reg_params, folds, n_samples):
+    """ Mean r2 of one set of reg_params over the cached folds, fitting on the first n_samples of each fold """
+    scores = []
+    for X_train, y_train, X_test, y_test, gate, order in folds:
+        sample = order[:n_samples]
+        reg = CustomRegressor._resolve_estimator(reg_name)
+        reg.set_params(**reg_params)
+        reg.fit(X_train[sample], y_train[sample])
+        scores.append(r2_score(y_test, gate * reg.predict(X_test)))
+    return np.mean(scores)
+
+
+class CachedSearch:
+    """ Search over candidate reg_params for a Pipeline of StandardScaler and CustomRegressor, scored by r2 with
+    k-fold cross validation. Follows the GridSearchCV interface used in modelling.py.
+    Args:
+        reg_params: list of candidate dicts of parameters for the regression sub-model
+        clf_name, reg_name, clf_params: passed to CustomRegressor
+        cv: number of folds
+        halving: if True run a successive halving search, otherwise score every candidate on the full folds
+        factor: each halving round keeps the best 1/factor of the candidates and multiplies the samples by factor
+        min_samples: the fewest samples per fold any candidate is scored on
+        n_jobs: number of candidates scored in parallel
+        random_state: seed for the subsamples used by the halving rounds
+    """
+
+    def __init__(self,
+                 reg_params: list,
+                 clf_name: str = 'logistic',
+                 reg_name: str = 'linear',
+                 clf_params: dict = None,
+                 cv: int = 4,
+                 halving: bool = True,
+                 factor: int = 3,
+                 min_samples: int = 100,
+                 n_jobs: int = -1,
+                 random_state: int = 0):
+
+        self.reg_params = reg_params
+        self.clf_name = clf_name
+        self.reg_name = reg_name
+        self.clf_params = clf_params
+        self.cv = cv
+        self.halving = halving
+        self.factor = factor
+        self.min_samples = min_samples
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _pipeline(self, reg_params):
+        return Pipeline([
+            ('scaler', StandardScaler()),
+            ('regressor', CustomRegressor(clf_name=self.clf_name, reg_name=self.reg_name,
+                                          clf_params=self.clf_params, reg_params=reg_params))
+        ])
+
+    def _cache_folds(self, X, y):
+        """ Fit the scaler and classifier of each fold once, returning everything the candidates share """
+        rng = np.random.RandomState(self.random_state)
+        folds = []
+        for train, test in KFold(n_splits=self.cv).split(X):
+            scaler = StandardScaler().fit(X[train])
+            X_train, X_test = scaler.transform(X[train]), scaler.transform(X[test])
+
+            clf = CustomRegressor._resolve_estimator(self.clf_name)
+            if self.clf_params:
+                clf.set_params(**self.clf_params)
+            clf.fit(X_train[:, 2].reshape(-1, 1), y[train] > 0)
+            gate = clf.predict(X_test[:, 2].reshape(-1, 1))
+
+            # a fixed random order per fold, so every halving round subsamples a prefix of it
+            folds.append((X_train, y[train], X_test, y[test], gate, rng.permutation(len(train))))
+        return folds
+
+    def _schedule(self, n_candidates, n_samples):
+        """ The number of samples each round is scored on, ending with every sample """
+        if not self.halving:
+            return [n_samples]
+        n_rounds = max(1, math.ceil(math.log(n_candidates) / math.log(self.factor)))
+        return [max(min(self.min_samples, n_samples), n_samples // self.factor ** (n_rounds - 1 - i))
+                for i in range(n_rounds)]
+
+    def fit(self, X, y):
+        X, y = np.asarray(X, dtype=np.float32), np.asarray(y, dtype=np.float32)
+        folds = self._cache_folds(X, y)
+        n_samples = min(len(fold[0]) for fold in folds)
+
+        candidates = list(self.reg_params)
+        self.cv_results_ = []
+        for round_samples in self._schedule(len(candidates), n_samples):
+            scores = Parallel(n_jobs=self.n_jobs)(
+                delayed(_score_candidate)(self.reg_name, params, folds, round_samples) for params in candidates)
+            self.cv_results_.append({'n_samples': round_samples, 'params': candidates, 'scores': scores})
+            print('Scored {} candidates on {} samples per fold'.format(len(candidates), round_samples))
+
+            # keep the best 1/factor of the candidates for the next round
+            ranking = np.argsort(scores)[::-1]
+            best_score = scores[ranking[0]]
+            candidates = [candidates[i] for i in ranking[:max(1, math.ceil(len(candidates) / self.factor))]]
+
+        self.best_params_ = {'regressor__reg_params': candidates[0]}
+        self.best_score_ = best_score
+
+        # refit the best candidate on all the data
+        self.best_estimator_ = self._pipeline(candidates[0]).fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(np.asarray(X, dtype=np.float32))
+
+    def score(self, X, y):
+        return r2_score(y, self.predict(X))
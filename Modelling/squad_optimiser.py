@@ -0,0 +1,148 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from scipy.optimize import milp, LinearConstraint, Bounds
+from scipy.sparse import csr_matrix, vstack, identity, hstack
+
+"""
+Picks the best legal squad and starting XI from the predictions table. The selection is solved exactly as an integer
+program with the HiGHS solver bundled with SciPy, after pruning players who could never make the optimal squad
+because enough cheaper, better players in the same position are available. It can also answer "best N transfers
+from my current squad" queries by limiting how many players outside the current squad may be picked.
+"""
+
+BUDGET = 100.0
+# number of players in each position in the squad
+SQUAD_POSITIONS = {'GKP': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
+# fewest and most players in each position in the starting XI
+XI_POSITIONS = {'GKP': (1, 1), 'DEF': (3, 5), 'MID': (2, 5), 'FWD': (1, 3)}
+XI_SIZE = 11
+MAX_PER_TEAM = 3
+# share of a substitute's predicted points counted towards the squad, to break ties between benches
+BENCH_WEIGHT = 0.1
+
+
+def load_candidates(engine, table='predictions'):
+    """ Join the predictions with player_info, summing over gameweeks for the horizon_predictions table """
+    predictions = pd.read_sql('SELECT * FROM {}'.format(table), engine)
+    predictions = predictions.groupby('player_id')['prediction'].sum()
+    player_info = pd.read_sql('SELECT * FROM player_info', engine, index_col='id')
+    return player_info.join(predictions, how='inner')
+
+
+def prune_candidates(candidates, keep=()):
+    """
+    Drop players who cannot be in any optimal squad. A player is dominated by another in the same position who costs
+    no more and is predicted no fewer points. If a player's dominators come from at least as many distinct teams as
+    there are squad places in the position plus the number of teams that could be full, one of them can always be
+    swapped in without breaking any rule or lowering the score, so the player can be dropped.
+    Args:
+        candidates: dataframe with prediction, current_price, position and team_name columns
+        keep: player ids which are never dropped, e.g. the current squad
+    """
+
+    max_full_teams = sum(SQUAD_POSITIONS.values()) // MAX_PER_TEAM
+    teams = pd.get_dummies(candidates['team_name']).to_numpy(dtype=np.int32)
+    prediction = candidates['prediction'].to_numpy()
+    price = candidates['current_price'].to_numpy()
+    position = candidates['position'].to_numpy()
+
+    prunable = np.zeros(len(candidates), dtype=bool)
+    for name, places in SQUAD_POSITIONS.items():
+        bucket = np.flatnonzero(position == name)
+        p, c = prediction[bucket], price[bucket]
+        # dominates[i, j] if player j dominates player i
+        dominates = ((c[None, :] <= c[:, None]) & (p[None, :] >= p[:, None]) &
+                     ((c[None, :] < c[:, None]) | (p[None, :] > p[:, None])))
+        dominating_teams = ((dominates.astype(np.int32) @ teams[bucket]) > 0).sum(axis=1)
+        prunable[bucket] = dominating_teams >= places + max_full_teams
+
+    prunable &= ~candidates.index.isin(list(keep))
+    return candidates[~prunable]
+
+
+def optimise_squad(candidates, budget=BUDGET, current_squad=None, max_transfers=None, bench_weight=BENCH_WEIGHT):
+    """
+    Choose the squad, starting XI and captain with the highest predicted points.
+    Args:
+        candidates: dataframe indexed by player id with prediction, current_price, position and team_name columns
+        budget: most the squad may cost, for transfers this is the bank plus the value of the current squad
+        current_squad: player ids of the current squad, for transfer queries
+        max_transfers: most players outside current_squad that may be picked
+        bench_weight: share of each substitute's predicted points counted
+    Returns a dataframe of the squad with starting and captain columns, and the predicted points of the XI with the
+    captain's points doubled.
+    """
+
+    current_squad = list(current_squad or [])
+    candidates = prune_candidates(candidates, keep=current_squad)
+    n = len(candidates)
+    prediction = candidates['prediction'].to_numpy(dtype=np.float64)
+    price = candidates['current_price'].to_numpy(dtype=np.float64)
+    position = candidates['position'].to_numpy()
+    team = candidates['team_name'].to_numpy()
+
+    # variables are [squad, starting, captain] for every player; starters score in full, substitutes a little and
+    # the captain's points are counted twice
+    objective = -np.concatenate([bench_weight * prediction, (1 - bench_weight) * prediction, prediction])
+
+    def row(squad=None, starting=None, captain=None):
+        return np.concatenate([squad if squad is not None else np.zeros(n),
+                               starting if starting is not None else np.zeros(n),
+                               captain if captain is not None else np.zeros(n)])
+
+    rows, lower, upper = [], [], []
+
+    def add(coefficients, lo, hi):
+        rows.append(coefficients)
+        lower.append(lo)
+        upper.append(hi)
+
+    for name, places in SQUAD_POSITIONS.items():
+        add(row(squad=(position == name).astype(float)), places, places)
+    for name, (fewest, most) in XI_POSITIONS.items():
+        add(row(starting=(position == name).astype(float)), fewest, most)
+    for name in np.unique(team):
+        add(row(squad=(team == name).astype(float)), 0, MAX_PER_TEAM)
+    add(row(squad=price), 0, budget)
+    add(row(starting=np.ones(n)), XI_SIZE, XI_SIZE)
+    add(row(captain=np.ones(n)), 1, 1)
+    if max_transfers is not None:
+        add(row(squad=(~candidates.index.isin(current_squad)).astype(float)), 0, max_transfers)
+
+    # only squad players can start, and only starters can captain
+    eye, zero = identity(n, format='csr'), csr_matrix((n, n))
+    linking = vstack([hstack([-eye, eye, zero]), hstack([zero, -eye, eye])])
+
+    constraints = [LinearConstraint(csr_matrix(np.array(rows)), lower, upper),
+                   LinearConstraint(linking, -np.inf, 0)]
+    result = milp(objective, constraints=constraints, integrality=np.ones(3 * n), bounds=Bounds(0, 1))
+
+    if not result.success:
+        raise ValueError('No legal squad found: {}'.format(result.message))
+
+    chosen = np.round(result.x).astype(bool)
+    squad = candidates.assign(starting=chosen[n:2 * n], captain=chosen[2 * n:])[chosen[:n]]
+    points = (squad['prediction'] * squad['starting']).sum() + squad.loc[squad['captain'], 'prediction'].sum()
+
+    order = {name: i for i, name in enumerate(SQUAD_POSITIONS)}
+    squad = squad.sort_values(['starting', 'position'], ascending=[False, True],
+                              key=lambda column: column.map(order) if column.name == 'position' else column)
+    return squad, points
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pick the best squad from the predictions table')
+    parser.add_argument('--db-uri', default=os.environ.get('POSTGRES'))
+    parser.add_argument('--table', default='predictions', help='predictions or horizon_predictions')
+    parser.add_argument('--budget', type=float, default=BUDGET)
+    parser.add_argument('--squad', type=int, nargs='*', help='player ids of the current squad')
+    parser.add_argument('--transfers', type=int, help='most transfers to make from the current squad')
+    args = parser.parse_args()
+
+    candidates = load_candidates(db.create_engine(args.db_uri), args.table)
+    squad, points = optimise_squad(candidates, args.budget, args.squad, args.transfers)
+    print(squad)
+    print('Predicted points: {:.1f}, cost: {:.1f}'.format(points, squad['current_price'].sum()))
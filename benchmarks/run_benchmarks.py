@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import subprocess
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+# the collector and modelling code are deployed as two flat directories, the modules they share are identical
+sys.path[:0] = [os.path.join(ROOT, 'DataCollector'), os.path.join(ROOT, 'Modelling')]
+
+import numpy as np
+import sqlalchemy as db
+from synthetic import bootstrap_static, element_summaries, database_tables, write_database
+from stub_server import StubServer
+
+"""
+Offline benchmark suite. Times the collector against the stub API, the player info step, the modelling
+preprocessing, CustomRegressor fit and predict, and the database writes, on synthetic data at a chosen scale, against
+a temporary SQLite database and optionally a local PostgreSQL one. Results are written to a JSON file, and a previous
+results file can be passed with --compare to print how much each benchmark has sped up or slowed down.
+"""
+
+
+def timed(function, repeats, setup=None):
+    """ Run function repeats times, calling setup first each time outside the timing, and return the durations """
+    durations = []
+    for _ in range(repeats):
+        arguments = [setup()] if setup else []
+        start = time.perf_counter()
+        function(*arguments)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def collector_benchmarks(args, tmp, results):
+    from fetcher import Fetcher
+    from summary_cache import SummaryCache
+    from archive import Archive
+    from data_collection import get_element_summaries, get_feature_data
+
+    bootstrap = bootstrap_static(args.players, n_gameweeks=args.gameweeks, current_gameweek=args.gameweeks // 2)
+    summaries = element_summaries(bootstrap)
+    players = bootstrap['elements']
+
+    with StubServer(bootstrap, summaries, latency=args.latency, jitter=args.latency) as stub:
+        fetcher = Fetcher(api_url=stub.url, rate=0)
+
+        # a fresh cache every time, so every summary is fetched from the stub
+        def fresh_cache():
+            return SummaryCache(tempfile.mkdtemp(dir=tmp)), Archive(tempfile.mkdtemp(dir=tmp))
+
+        fetched = {}
+
+        def fetch(stores):
+            fetched['summaries'] = get_element_summaries(players, fetcher, cache=stores[0], archive=stores[1])
+
+        results.append(('fetch element summaries', len(players), timed(fetch, args.repeats, fresh_cache)))
+
+        fetched_summaries, failures = fetched['summaries']
+        results.append(('get_feature_data', len(players),
+                        timed(lambda: get_feature_data(players, fetched_summaries, failures), args.repeats)))
+
+    return bootstrap, summaries
+
+
+def player_info_benchmark(args, tmp, bootstrap, summaries, uri, backend, results):
+    from fetcher import Fetcher
+    from bootstrap import BootstrapSnapshot
+    from get_player_info import get_player_info
+
+    with StubServer(bootstrap, summaries) as stub:
+        snapshot = BootstrapSnapshot(Fetcher(api_url=stub.url, rate=0), cache_dir=tempfile.mkdtemp(dir=tmp)).load()
+        results.append(('get_player_info [{}]'.format(backend), len(bootstrap['elements']),
+                        timed(lambda: get_player_info(uri, snapshot), args.repeats)))
+
+
+def modelling_benchmarks(args, tmp, tables, engine, backend, results):
+    from db_writer import write_frame
+    from feature_store import FeatureStore
+    from invoke_data_modelling import prepare_modelling_data
+    from custom_regressor import CustomRegressor
+
+    features = tables['features']
+    results.append(('write features [{}]'.format(backend), len(features), timed(
+        lambda: write_frame(features, 'features_benchmark', engine, if_exists='replace'), args.repeats)))
+
+    prepared = {}
+
+    def preprocess(store):
+        # the same steps as invoke_data_modelling.run_modelling, up to the modelling step
+        prepared['X'], prepared['y'], prepared['X_new'] = prepare_modelling_data(engine, horizon=0, store=store)[:3]
+
+    results.append(('modelling preprocessing [{}]'.format(backend), len(features),
+                    timed(preprocess, args.repeats, lambda: FeatureStore(tempfile.mkdtemp(dir=tmp)))))
+
+    X, y, X_new = prepared['X'].to_numpy(), prepared['y'].to_numpy(), prepared['X_new'].to_numpy()
+    reg_params = {'max_depth': 5, 'min_samples_leaf': 4, 'min_samples_split': 4}
+    regressor = CustomRegressor(reg_params=reg_params)
+    results.append(('CustomRegressor.fit [{}]'.format(backend), len(X),
+                    timed(lambda: regressor.fit(X, y), args.repeats)))
+    results.append(('CustomRegressor.predict [{}]'.format(backend), len(X_new),
+                    timed(lambda: regressor.predict(X_new), args.repeats)))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, previous_path):
+    """ Print the change in median time of each benchmark against a previous results file """
+    with open(previous_path) as f:
+        previous = {result['name']: result for result in json.load(f)['results']}
+    for result in results:
+        if result['name'] in previous:
+            ratio = result['median_seconds'] / previous[result['name']]['median_seconds']
+            print('{:45s} {:8.3f}s -> {:8.3f}s  ({:+.0%})'.format(
+                result['name'], previous[result['name']]['median_seconds'], result['median_seconds'], ratio - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline benchmark suite on synthetic data')
+    parser.add_argument('--players', type=int, default=600)
+    parser.add_argument('--gameweeks', type=int, default=38)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the stub API delays each response by')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--postgres-uri', help='local PostgreSQL database to also benchmark against, its tables are '
+                                               'replaced')
+    parser.add_argument('--output', default=os.path.join(HERE, 'results.json'))
+    parser.add_argument('--compare', help='previous results file to compare against')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bootstrap, summaries = collector_benchmarks(args, tmp, results)
+
+        tables = database_tables(args.players, args.gameweeks, args.seasons)
+        backends = [('sqlite', 'sqlite:///{}'.format(os.path.join(tmp, 'benchmark.db')))]
+        if args.postgres_uri:
+            backends.append(('postgresql', args.postgres_uri))
+
+        for backend, uri in backends:
+            engine = db.create_engine(uri)
+            write_database(engine, tables)
+            player_info_benchmark(args, tmp, bootstrap, summaries, uri, backend, results)
+            modelling_benchmarks(args, tmp, tables, engine, backend, results)
+            engine.dispose()
+
+    results = [{'name': name, 'rows': rows, 'repeats': len(durations),
+                'median_seconds': statistics.median(durations), 'min_seconds': min(durations)}
+               for name, rows, durations in results]
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'numpy': np.__version__, 'players': args.players,
+                 'gameweeks': args.gameweeks, 'seasons': args.seasons, 'latency': args.latency},
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        print('{:45s} {:8.3f}s median over {} runs, {} rows'.format(
+            result['name'], result['median_seconds'], result['repeats'], result['rows']))
+    print('Results written to {}'.format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
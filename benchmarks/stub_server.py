@@ -0,0 +1,119 @@
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from synthetic import bootstrap_static, element_summaries, fixtures
+
+"""
+Local HTTP stub of the FPL API endpoints the collector uses, bootstrap-static/, fixtures/ and element-summary/<id>/,
+serving synthetic payloads. A fixed latency, random jitter and a rate of retryable 503 errors can be injected to mimic
+the real API, and bootstrap-static/ answers conditional requests with 304 Not Modified. Point the collector at it by
+setting FPL_API_URL to the stub's url, or pass the url to a Fetcher.
+"""
+
+ELEMENT_SUMMARY = re.compile(r'^/api/element-summary/(\d+)/?$')
+
+
+class StubServer:
+    """ Serves the stub API from a background thread, usable as a context manager.
+    Args:
+        bootstrap: bootstrap-static payload
+        summaries: element-summary payloads keyed by player id
+        latency: seconds every response is delayed by
+        jitter: most extra seconds, chosen at random, each response is delayed by
+        error_rate: share of requests answered with a 503
+        port: port to listen on, 0 picks a free one
+    """
+
+    def __init__(self, bootstrap, summaries, latency=0.0, jitter=0.0, error_rate=0.0, port=0):
+        self.bootstrap = json.dumps(bootstrap).encode()
+        self.etag = '"{}"'.format(hashlib.sha1(self.bootstrap).hexdigest())
+        self.summaries = {int(player_id): json.dumps(summary).encode() for player_id, summary in summaries.items()}
+        # every upcoming fixture, as listed in the summaries
+        self.fixtures = json.dumps(fixtures(summaries)).encode()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/'.format(self.server.server_address[1])
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency + random.uniform(0, stub.jitter))
+                if random.random() < stub.error_rate:
+                    return self._send(503)
+
+                if self.path.rstrip('/') == '/api/bootstrap-static':
+                    if self.headers.get('If-None-Match') == stub.etag:
+                        return self._send(304, headers={'ETag': stub.etag})
+                    return self._send(200, stub.bootstrap, {'Content-Type': 'application/json', 'ETag': stub.etag})
+
+                if self.path.rstrip('/') == '/api/fixtures':
+                    return self._send(200, stub.fixtures, {'Content-Type': 'application/json'})
+
+                match = ELEMENT_SUMMARY.match(self.path)
+                if match and int(match.group(1)) in stub.summaries:
+                    return self._send(200, stub.summaries[int(match.group(1))], {'Content-Type': 'application/json'})
+
+                self._send(404)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a stub of the FPL API with synthetic data')
+    parser.add_argument('--players', type=int, default=600)
+    parser.add_argument('--gameweeks', type=int, default=38)
+    parser.add_argument('--current-gameweek', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every response is delayed by')
+    parser.add_argument('--jitter', type=float, default=0.0, help='most extra seconds a response is delayed by')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    bootstrap = bootstrap_static(args.players, n_gameweeks=args.gameweeks, current_gameweek=args.current_gameweek)
+    server = StubServer(bootstrap, element_summaries(bootstrap), args.latency, args.jitter, args.error_rate, args.port)
+    print('Serving the stub API at {}, set FPL_API_URL to use it'.format(server.url))
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
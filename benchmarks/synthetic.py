@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+"""
+Synthetic FPL data at any scale, shaped like the real API payloads and database tables so the collector and the
+modelling code can be run offline. bootstrap_static and element_summaries build the payloads served by the stub API
+in stub_server.py, and database_tables builds the tables the collector would have written after a number of seasons.
+Everything is generated from a seed, so the same arguments always give the same data.
+"""
+
+POSITIONS = {1: 'GKP', 2: 'DEF', 3: 'MID', 4: 'FWD'}
+STATUSES = ['a', 'a', 'a', 'a', 'a', 'a', 'a', 'd', 'i', 's', 'u']
+# tables written with their index as a column, as the collector and modelling functions write them
+INDEXED_TABLES = ['features', 'response', 'player_info', 'hyperparameters']
+
+
+def _deadlines(n_gameweeks, current_gameweek, now=None):
+    """ Weekly deadlines with the current gameweek finished and the next one's deadline still to come """
+    now = pd.Timestamp.now(tz='UTC').floor('s') if now is None else pd.Timestamp(now, tz='UTC')
+    return [now + pd.Timedelta(weeks=gameweek - current_gameweek - 0.5) for gameweek in range(1, n_gameweeks + 1)]
+
+
+def bootstrap_static(n_players=600, n_teams=20, n_gameweeks=38, current_gameweek=10, now=None, seed=0):
+    """ A bootstrap-static payload with n_players players spread over n_teams teams, part way through a season of
+    n_gameweeks gameweeks, with current_gameweek just finished """
+
+    rng = np.random.default_rng(seed)
+    deadlines = _deadlines(n_gameweeks, current_gameweek, now)
+
+    events = [{'id': gameweek, 'name': 'Gameweek {}'.format(gameweek),
+               'deadline_time': deadline.strftime('%Y-%m-%dT%H:%M:%SZ'),
+               'finished': gameweek <= current_gameweek, 'is_current': gameweek == current_gameweek,
+               'is_next': gameweek == current_gameweek + 1}
+              for gameweek, deadline in enumerate(deadlines, start=1)]
+
+    teams = [{'id': team, 'name': 'Team {}'.format(team), 'short_name': 'T{:02d}'.format(team),
+              'strength': int(rng.integers(2, 6))} for team in range(1, n_teams + 1)]
+
+    elements = []
+    for player_id in range(1, n_players + 1):
+        status = str(rng.choice(STATUSES))
+        minutes = int(rng.integers(0, 90 * current_gameweek + 1))
+        total_points = int(minutes / 90 * rng.uniform(1, 7))
+        elements.append({
+            'id': player_id,
+            'first_name': 'First{}'.format(player_id),
+            'second_name': 'Second{}'.format(player_id),
+            'web_name': 'Player{}'.format(player_id),
+            'team': int(rng.integers(1, n_teams + 1)),
+            'element_type': int(rng.choice([1, 2, 2, 3, 3, 4])),
+            'now_cost': int(rng.integers(40, 130)),
+            'status': status,
+            'chance_of_playing_this_round': None if status == 'a' else int(rng.choice([0, 25, 50, 75])),
+            'form': '{:.1f}'.format(rng.uniform(0, 10)),
+            'points_per_game': '{:.1f}'.format(total_points / max(1, current_gameweek)),
+            'ict_index': '{:.1f}'.format(rng.uniform(0, 150)),
+            'total_points': total_points,
+            'minutes': minutes
+        })
+
+    return {'events': events, 'teams': teams, 'elements': elements,
+            'element_types': [{'id': key, 'singular_name_short': value} for key, value in POSITIONS.items()]}
+
+
+def element_summaries(bootstrap, seed=0):
+    """ The element-summary payload of every player in a bootstrap payload, keyed by player id, with a match in
+    the history for every finished gameweek and a fixture for every gameweek still to come """
+
+    rng = np.random.default_rng(seed)
+    teams = [team['id'] for team in bootstrap['teams']]
+    strengths = {team['id']: team['strength'] for team in bootstrap['teams']}
+    events = bootstrap['events']
+
+    summaries = {}
+    for player in bootstrap['elements']:
+        history, fixtures = [], []
+        for event in events:
+            opponent = int(rng.choice([team for team in teams if team != player['team']]))
+            is_home = bool(rng.integers(0, 2))
+            if event['finished']:
+                minutes = int(rng.choice([0, 0, 30, 60, 90, 90, 90]))
+                influence, creativity, threat = rng.uniform(0, 60, 3) * (minutes > 0)
+                history.append({
+                    'element': player['id'], 'fixture': event['id'] * 100 + player['team'], 'round': event['id'],
+                    'kickoff_time': event['deadline_time'], 'was_home': is_home, 'opponent_team': opponent,
+                    'total_points': int(rng.integers(0, 15)) if minutes else 0, 'minutes': minutes,
+                    'bps': int(rng.integers(0, 40)) if minutes else 0, 'influence': '{:.1f}'.format(influence),
+                    'creativity': '{:.1f}'.format(creativity), 'threat': '{:.1f}'.format(threat),
+                    'ict_index': '{:.1f}'.format((influence + creativity + threat) / 10)
+                })
+            else:
+                fixtures.append({
+                    'id': event['id'] * 100 + player['team'], 'event': event['id'],
+                    'kickoff_time': event['deadline_time'], 'is_home': is_home,
+                    'team_h': player['team'] if is_home else opponent,
+                    'team_a': opponent if is_home else player['team'],
+                    'difficulty': strengths[opponent]
+                })
+        summaries[player['id']] = {'history': history, 'fixtures': fixtures, 'history_past': []}
+
+    return summaries
+
+
+def fixtures(summaries):
+    """ The fixtures/ payload of the upcoming fixtures in a set of element-summary payloads """
+    payload = {}
+    for summary in summaries.values():
+        for fixture in summary['fixtures']:
+            home_difficulty = fixture['difficulty'] if fixture['is_home'] else 3
+            away_difficulty = 3 if fixture['is_home'] else fixture['difficulty']
+            payload.setdefault((fixture['id'], fixture['team_h'], fixture['team_a']), {
+                'id': fixture['id'], 'event': fixture['event'], 'kickoff_time': fixture['kickoff_time'],
+                'team_h': fixture['team_h'], 'team_a': fixture['team_a'], 'team_h_difficulty': home_difficulty,
+                'team_a_difficulty': away_difficulty, 'finished': False
+            })
+    return list(payload.values())
+
+
+def database_tables(n_players=600, n_gameweeks=38, n_seasons=1, first_season=2020, seed=0):
+    """
+    The features, response, history, player_info, fixtures and hyperparameters tables the collector and modelling
+    functions would have written after n_seasons seasons, as dataframes keyed by table name. The last gameweek has
+    no response yet, as if it had just been collected.
+    """
+
+    rng = np.random.default_rng(seed)
+    player_ids = np.arange(1, n_players + 1)
+    player_teams = rng.integers(1, 21, n_players)
+
+    features, history = [], []
+    for season in range(first_season, first_season + n_seasons):
+        gameweeks = np.repeat(np.arange(1, n_gameweeks + 1), n_players)
+        n = len(gameweeks)
+        deadlines = pd.Timestamp(season, 8, 14) + pd.to_timedelta((gameweeks - 1) * 7, unit='D')
+        chance = rng.choice([np.nan] * 8 + [0, 25, 50, 75], n)
+        features.append(pd.DataFrame({
+            'player_id': np.tile(player_ids, n_gameweeks),
+            'team_id': np.tile(player_teams, n_gameweeks),
+            'ict_index': rng.uniform(0, 150, n).round(1),
+            'chance_of_playing': chance,
+            'form': rng.uniform(0, 10, n).round(1),
+            'points_per_game': rng.uniform(0, 8, n).round(1),
+            'previous_points': rng.integers(0, 15, n),
+            'is_home': rng.integers(0, 2, n),
+            'next_fixture_difficulty': rng.integers(2, 6, n),
+            'timestamp': deadlines - pd.Timedelta(days=1),
+            'season': season,
+            'gameweek': gameweeks
+        }))
+        minutes = rng.choice([0, 0, 30, 60, 90, 90, 90], n)
+        history.append(pd.DataFrame({
+            'player_id': np.tile(player_ids, n_gameweeks),
+            'fixture': gameweeks * 100 + np.tile(player_teams, n_gameweeks),
+            'round': gameweeks,
+            'kickoff_time': deadlines + pd.Timedelta(hours=2),
+            'was_home': rng.integers(0, 2, n),
+            'opponent_team': rng.integers(1, 21, n),
+            'total_points': np.where(minutes > 0, rng.integers(0, 15, n), 0),
+            'minutes': minutes,
+            'bps': np.where(minutes > 0, rng.integers(0, 40, n), 0),
+            'influence': rng.uniform(0, 60, n).round(1),
+            'creativity': rng.uniform(0, 60, n).round(1),
+            'threat': rng.uniform(0, 60, n).round(1),
+            'ict_index': rng.uniform(0, 18, n).round(1)
+        }))
+
+    features = pd.concat(features, ignore_index=True)
+    features.index = pd.RangeIndex(1, len(features) + 1, name='entry_id')
+    history = pd.concat(history, ignore_index=True)
+
+    # points follow form and availability, so the model has something to learn
+    points = (features['form'] * 0.8 + rng.normal(0, 2, len(features))).clip(0).round()
+    points[features['chance_of_playing'] == 0] = 0
+    latest = (features['season'] == features['season'].max()) & (features['gameweek'] == n_gameweeks)
+    response = points[~latest].astype(np.int64).rename('points_scored').to_frame()
+
+    player_info = pd.DataFrame({
+        'first_name': ['First{}'.format(i) for i in player_ids],
+        'second_name': ['Second{}'.format(i) for i in player_ids],
+        'position': rng.choice(list(POSITIONS.values()), n_players),
+        'status': rng.choice(STATUSES, n_players),
+        'current_price': rng.integers(40, 130, n_players) / 10,
+        'team_name': ['Team {}'.format(team) for team in player_teams],
+        'team_short_name': ['T{:02d}'.format(team) for team in player_teams]
+    }, index=pd.Index(player_ids, name='id'))
+
+    fixtures = pd.DataFrame({
+        'player_id': np.repeat(player_ids, 5),
+        'fixture': np.arange(n_players * 5),
+        'event': np.tile(np.arange(1, 6), n_players),
+        'kickoff_time': pd.Timestamp(first_season + n_seasons, 8, 14),
+        'is_home': rng.integers(0, 2, n_players * 5),
+        'difficulty': rng.integers(2, 6, n_players * 5)
+    })
+
+    hyperparameters = pd.DataFrame({'max_depth': [5], 'min_samples_leaf': [4], 'min_samples_split': [4]})
+
+    return {'features': features, 'response': response, 'history': history, 'player_info': player_info,
+            'fixtures': fixtures, 'hyperparameters': hyperparameters}
+
+
+def write_database(engine, tables):
+    """ Write the tables from database_tables to a database, replacing any already there, and migrate the schema """
+    from db_writer import write_frame
+    from schema import migrate
+
+    with engine.begin() as connection:
+        for name, frame in tables.items():
+            write_frame(frame, name, connection, if_exists='replace', index=name in INDEXED_TABLES)
+        # the replaced features table has none of the migrations applied
+        connection.execute('DROP TABLE IF EXISTS schema_migrations')
+    migrate(engine)
@@ -0,0 +1,82 @@
+import os
+import sys
+import hashlib
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# the collector and modelling code are deployed as two flat directories, the modules they share are identical
+sys.path[:0] = [os.path.join(ROOT, 'DataCollector'), os.path.join(ROOT, 'Modelling')]
+
+import sqlalchemy as db
+from fetcher import Fetcher, API_URL
+from bootstrap import BootstrapSnapshot
+from data_collection import data_collection
+from get_player_info import get_player_info
+from invoke_data_modelling import run_modelling
+from feature_store import FeatureStore
+from horizon import HORIZON
+from executors import EXECUTORS, get_executor
+
+"""
+Runs the whole pipeline in one process, without AWS: data collection, player info, modelling and predictions, against
+any database SQLAlchemy can connect to. The modelling step runs on the executor chosen with --executor, in process
+by default, so the frames are handed straight to the model rather than sent to the DataModelling Lambda function.
+Point --api-url at the stub server in benchmarks/stub_server.py to run it entirely offline.
+
+The feature store and the saved models hold rows and fits of one database, so each database gets its own directory
+for them under FPL_PIPELINE_DIR, unless they are given with --feature-store-dir and --artifact-dir. Models fitted by
+the lambda executor are saved by the Lambda function, in its own ARTIFACT_DIR.
+"""
+
+PIPELINE_DIR = os.environ.get('FPL_PIPELINE_DIR', os.path.join(tempfile.gettempdir(), 'fpl_pipeline'))
+
+
+def database_dir(db_uri):
+    """ Directory for the feature store and saved models of one database """
+    return os.path.join(PIPELINE_DIR, hashlib.sha1(db_uri.encode()).hexdigest()[:16])
+
+
+def run_pipeline(db_uri, executor='in_process', horizon=HORIZON, api_url=API_URL, skip_collection=False,
+                 feature_store_dir=None, artifact_dir=None):
+    """ Run collection, player info and modelling against db_uri and return the predictions written. The feature
+    store and saved models are kept in directories of their own for db_uri unless others are given. """
+
+    if not skip_collection:
+        # Fetch the bootstrap data once for both collectors
+        snapshot = BootstrapSnapshot(Fetcher(api_url=api_url)).load()
+        data_collection(db_uri, snapshot)
+        get_player_info(db_uri, snapshot)
+        snapshot.commit()
+
+    store = FeatureStore(feature_store_dir or os.path.join(database_dir(db_uri), 'feature_store'))
+    options = {} if executor == 'lambda' else {
+        'artifact_dir': artifact_dir or os.path.join(database_dir(db_uri), 'model_artifacts')}
+
+    engine = db.create_engine(db_uri)
+    modelling_executor = get_executor(executor, **options)
+    try:
+        return run_modelling(engine, modelling_executor, horizon, store)
+    finally:
+        if hasattr(modelling_executor, 'shutdown'):
+            modelling_executor.shutdown()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run collection, player info and modelling end to end')
+    parser.add_argument('--db-uri', default=os.environ.get('POSTGRES', 'sqlite:///fpl.db'))
+    parser.add_argument('--executor', default='in_process', choices=list(EXECUTORS))
+    parser.add_argument('--horizon', type=int, default=HORIZON, help='gameweeks to predict at once, 0 for one')
+    parser.add_argument('--api-url', default=API_URL)
+    parser.add_argument('--skip-collection', action='store_true', help='model the data already in the database')
+    parser.add_argument('--feature-store-dir', help='feature store of this database, one under FPL_PIPELINE_DIR by '
+                                                    'default')
+    parser.add_argument('--artifact-dir', help='saved models of this database, one under FPL_PIPELINE_DIR by default')
+    parser.add_argument('--top', type=int, default=20, help='number of predictions to print')
+    args = parser.parse_args()
+
+    predictions = run_pipeline(args.db_uri, args.executor, args.horizon, args.api_url, args.skip_collection,
+                               args.feature_store_dir, args.artifact_dir)
+    if predictions is not None:
+        print(predictions.head(args.top).to_string())
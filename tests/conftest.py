@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the collector and modelling code are deployed as two flat directories, the modules they share are identical
+sys.path[:0] = [os.path.join(ROOT, 'DataCollector'), os.path.join(ROOT, 'Modelling'), os.path.join(ROOT, 'benchmarks'),
+                ROOT]
+
+# the caches default to fixed directories under /tmp, read when the modules are imported, so keep the tests' apart
+_cache = tempfile.mkdtemp(prefix='fpl_tests_')
+os.environ['FPL_CACHE_DIR'] = os.path.join(_cache, 'fpl_cache')
+os.environ['FEATURE_STORE_DIR'] = os.path.join(_cache, 'feature_store')
+os.environ['ARTIFACT_DIR'] = os.path.join(_cache, 'model_artifacts')
+os.environ['FPL_PIPELINE_DIR'] = os.path.join(_cache, 'fpl_pipeline')
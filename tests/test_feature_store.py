@@ -0,0 +1,38 @@
+import pandas as pd
+import sqlalchemy as db
+from synthetic import database_tables
+from feature_store import FeatureStore
+from rolling_features import load_history
+
+
+def assert_history_matches(store, engine):
+    stored = store.history()
+    expected = load_history(engine).sort_values(['kickoff_time', 'player_id'], ignore_index=True)
+    assert list(stored['player_id']) == list(expected['player_id'])
+    assert (stored['total_points'].values == expected['total_points'].values).all()
+
+
+def test_history_is_synced_incrementally(tmp_path):
+    tables = database_tables(n_players=50, n_gameweeks=20)
+    engine = db.create_engine('sqlite:///{}'.format(tmp_path / 'fpl.db'))
+    tables['features'].to_sql('features', engine)
+    history = tables['history']
+    cut = history['kickoff_time'].sort_values().iloc[len(history) // 2]
+    history[history['kickoff_time'] < cut].to_sql('history', engine, index=False)
+
+    store = FeatureStore(str(tmp_path / 'store')).sync(engine)
+    assert_history_matches(store, engine)
+
+    # later matches only fetch the last few days of the stored history again
+    history[history['kickoff_time'] >= cut].to_sql('history', engine, index=False, if_exists='append')
+    stable_rows = store.meta['history_stable_rows']
+    store.sync(engine)
+    assert store.meta['history_stable_rows'] > stable_rows
+    assert_history_matches(store, engine)
+
+    # a backfilled season adds earlier matches, so the whole history is fetched again
+    earlier = history.assign(kickoff_time=history['kickoff_time'] - pd.Timedelta(days=365))
+    earlier.to_sql('history', engine, index=False, if_exists='append')
+    store.sync(engine)
+    assert_history_matches(store, engine)
+    assert len(FeatureStore(str(tmp_path / 'store')).history()) == 2 * len(history)
@@ -0,0 +1,27 @@
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from custom_regressor import CustomRegressor
+from forest_export import export_pipeline
+from forest_inference import ForestModel
+
+
+def fitted_pipeline(X, y):
+    return Pipeline([('scaler', StandardScaler()),
+                     ('regressor', CustomRegressor(reg_params={'max_depth': 6, 'min_samples_leaf': 2}))]).fit(X, y)
+
+
+def test_exported_forest_matches_pipeline_on_float32_input(tmp_path):
+    # float32, as the modelling functions pass the frames built with the feature schema
+    rng = np.random.default_rng(0)
+    X = (rng.random((5000, 8)) * 10).astype(np.float32)
+    y = np.where(X[:, 2] > 3, X[:, 0] + rng.normal(size=len(X)), 0)
+    X_new = (rng.random((650, 8)) * 10).astype(np.float32)
+
+    pipe = fitted_pipeline(X, y)
+    path = str(tmp_path / 'forest.npz')
+    export_pipeline(pipe, path)
+    model = ForestModel(path)
+
+    assert np.allclose(model.predict(X_new), pipe.predict(X_new))
+    assert np.allclose(model.predict(X), pipe.predict(X))
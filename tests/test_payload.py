@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from payload import encode_frame, decode_frame, encode_payload
+from feature_schema import apply_schema
+
+
+def features_frame(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'ict_index': rng.uniform(0, 150, rows),
+        'chance_of_playing': rng.choice([0, 25, 50, 100], rows),
+        'form': rng.uniform(0, 10, rows),
+        'previous_points': rng.integers(0, 15, rows),
+        'is_home': rng.integers(0, 2, rows),
+    }, index=pd.RangeIndex(1, rows + 1, name='entry_id'))
+    return apply_schema(frame)
+
+
+def test_frame_round_trip_keeps_values_and_dtypes():
+    frame = features_frame()
+    decoded = decode_frame(json.loads(json.dumps(encode_frame(frame, store=None))), store=None)
+    pd.testing.assert_frame_equal(decoded, frame, check_index_type=False)
+    assert decoded.index.name == 'entry_id'
+
+
+def test_series_round_trip():
+    series = pd.Series(np.arange(10, dtype=np.int16), index=pd.Index(np.arange(10), name='entry_id'),
+                       name='points_scored')
+    decoded = decode_frame(encode_frame(series, store=None), store=None)
+    pd.testing.assert_series_equal(decoded, series)
+
+
+def test_large_frame_is_passed_by_reference(tmp_path):
+    frame = features_frame()
+    encoded = encode_frame(frame, store=str(tmp_path), inline_limit=100)
+    assert 'ref' in encoded and 'data' not in encoded
+    pd.testing.assert_frame_equal(decode_frame(encoded, store=str(tmp_path)), frame, check_index_type=False)
+
+    # the modelling function deletes each frame once it has read it
+    decode_frame(encoded, store=str(tmp_path), delete=True)
+    assert not list(tmp_path.iterdir())
+
+
+def test_payload_spills_largest_frames_until_it_fits(tmp_path):
+    X, X_new = features_frame(5000), features_frame(50, seed=1)
+    inline = encode_payload({'grid': False}, {'X': X, 'X_new': X_new}, store=None, limit=10 ** 9)
+    limit = len(inline) - 1000
+
+    payload = json.loads(encode_payload({'grid': False}, {'X': X, 'X_new': X_new}, store=str(tmp_path), limit=limit))
+    assert len(json.dumps(payload)) <= limit
+    assert 'ref' in payload['X'] and 'data' in payload['X_new']
+    pd.testing.assert_frame_equal(decode_frame(payload['X'], store=str(tmp_path)), X, check_index_type=False)
+    pd.testing.assert_frame_equal(decode_frame(payload['X_new'], store=str(tmp_path)), X_new, check_index_type=False)
+
+
+def test_payload_over_limit_without_store_raises():
+    with pytest.raises(ValueError):
+        encode_payload({}, {'X': features_frame(5000)}, store=None, limit=1000)
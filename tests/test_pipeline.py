@@ -0,0 +1,96 @@
+import pandas as pd
+import sqlalchemy as db
+from synthetic import bootstrap_static, element_summaries
+from stub_server import StubServer
+from schema import season_of
+from run_pipeline import run_pipeline
+from fetcher import Fetcher
+from bootstrap import BootstrapSnapshot
+from data_collection import data_collection
+
+PLAYERS = 40
+
+
+def collection_time():
+    # the collector only updates while the next deadline is still to come, so the deadlines follow the clock, moved
+    # on if need be so the first gameweek of both runs below falls in the same season
+    now = pd.Timestamp.now(tz='UTC').floor('s')
+    if season_of(now - pd.Timedelta(weeks=5.5)) != season_of(now - pd.Timedelta(weeks=4.5)):
+        now += pd.Timedelta(weeks=2)
+    return now.tz_localize(None)
+
+
+NOW = collection_time()
+
+
+def collect_and_model(db_uri, current_gameweek, **kwargs):
+    bootstrap = bootstrap_static(PLAYERS, current_gameweek=current_gameweek, now=NOW)
+    with StubServer(bootstrap, element_summaries(bootstrap)) as stub:
+        return run_pipeline(db_uri, api_url=stub.url, **kwargs)
+
+
+def test_pipeline_runs_from_an_empty_database(tmp_path):
+    db_uri = 'sqlite:///{}'.format(tmp_path / 'fpl.db')
+
+    # the first collection has no response yet, so there is nothing to train on
+    assert collect_and_model(db_uri, current_gameweek=5) is None
+
+    # the next gameweek's collection writes the response of the first
+    predictions = collect_and_model(db_uri, current_gameweek=6)
+    assert len(predictions) == PLAYERS
+    assert predictions['prediction'].notna().all()
+
+    engine = db.create_engine(db_uri)
+    stored = pd.read_sql('SELECT * FROM predictions', engine, index_col='player_id')
+    assert len(stored) == PLAYERS
+    assert list(engine.execute('SELECT COUNT(*) FROM response'))[0][0] == PLAYERS
+
+
+def test_pipeline_keeps_feature_stores_per_database(tmp_path):
+    first, second = ('sqlite:///{}'.format(tmp_path / name) for name in ('first.db', 'second.db'))
+    collect_and_model(first, current_gameweek=5)
+    collect_and_model(first, current_gameweek=6)
+
+    # the second database only has the first gameweek, so it must not pick up the first database's rows or model
+    assert collect_and_model(second, current_gameweek=5) is None
+
+
+def test_pipeline_predicts_a_horizon(tmp_path):
+    db_uri = 'sqlite:///{}'.format(tmp_path / 'fpl.db')
+    collect_and_model(db_uri, current_gameweek=5, horizon=3)
+    predictions = collect_and_model(db_uri, current_gameweek=6, horizon=3)
+    assert len(predictions) == PLAYERS
+
+    engine = db.create_engine(db_uri)
+    horizon = pd.read_sql('SELECT * FROM horizon_predictions', engine)
+    assert len(horizon) == 3 * PLAYERS
+    # the horizon starts at the gameweek the latest rows are collected for, and the collector drops played fixtures
+    assert sorted(horizon['gameweek'].unique()) == [7, 8, 9]
+    assert list(engine.execute('SELECT MIN(event) FROM fixtures'))[0][0] == 7
+
+    # fixtures kept from an earlier run, as for a player whose summary could not be fetched, are never predicted
+    fixtures = pd.read_sql('SELECT * FROM fixtures', engine)
+    fixtures.assign(event=6).to_sql('fixtures', engine, if_exists='append', index=False)
+    predictions = run_pipeline(db_uri, horizon=3, skip_collection=True)
+    assert sorted(pd.read_sql('SELECT * FROM horizon_predictions', engine)['gameweek'].unique()) == [7, 8, 9]
+    assert (predictions['prediction'] > 0).any()
+
+
+def test_moved_fixtures_are_refetched(tmp_path):
+    db_uri = 'sqlite:///{}'.format(tmp_path / 'fpl.db')
+    bootstrap = bootstrap_static(PLAYERS, current_gameweek=5, now=NOW)
+    summaries = element_summaries(bootstrap)
+    with StubServer(bootstrap, summaries) as stub:
+        data_collection(db_uri, BootstrapSnapshot(Fetcher(api_url=stub.url)).load())
+
+    # move one team's next fixture into a later gameweek without any deadline changing
+    team = bootstrap['elements'][0]['team']
+    for player in bootstrap['elements']:
+        if player['team'] == team:
+            summaries[player['id']]['fixtures'][0]['event'] += 1
+    with StubServer(bootstrap, summaries) as stub:
+        data_collection(db_uri, BootstrapSnapshot(Fetcher(api_url=stub.url)).load())
+
+    fixtures = pd.read_sql('SELECT player_id, event FROM fixtures', db.create_engine(db_uri))
+    moved = [player['id'] for player in bootstrap['elements'] if player['team'] == team]
+    assert (fixtures[fixtures['player_id'].isin(moved)].groupby('player_id')['event'].min() == 7).all()